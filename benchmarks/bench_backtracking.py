@@ -0,0 +1,36 @@
+"""
+Worst cases for maximal munch: with the tokens a and a+b, every lexeme of a word made only of a's is found after
+scanning the rest of the word, so the default lexer takes quadratic time. The linear mode should scale linearly.
+
+Run from the root of the repository: python -m benchmarks.bench_backtracking
+"""
+import time
+from src.Lex import Lexer
+
+
+def _time(lexer, word):
+    start = time.perf_counter()
+    lexer.lex(word)
+    return time.perf_counter() - start
+
+
+def main():
+    cases = [
+        ({"A": "a", "AB": "a+b"}, "a"),
+        ({"A": "a", "B": "b", "ABAC": "a(ba)*c"}, "ab"),
+    ]
+    for spec, unit in cases:
+        default = Lexer(spec)
+        linear = Lexer(spec, linear=True)
+        print(spec, "on", repr(unit), "* k")
+        print("%10s %14s %14s %16s" % ("n", "default (s)", "linear (s)", "linear us/char"))
+        for n in [1000, 2000, 4000, 8000, 16000, 32000]:
+            word = unit * (n // len(unit))
+            linear_time = _time(linear, word)
+            default_time = _time(default, word) if n <= 8000 else float("nan")
+            print("%10d %14.4f %14.4f %16.3f" % (n, default_time, linear_time, linear_time / n * 1e6))
+        print()
+
+
+if __name__ == "__main__":
+    main()
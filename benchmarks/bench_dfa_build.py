@@ -0,0 +1,38 @@
+"""
+Time to build a lexer for growing lists of keywords, plus an identifier and a space token, with the number of states
+of the resulting DFA before and after minimization.
+
+Run from the root of the repository: python -m benchmarks.bench_dfa_build
+"""
+import random
+import string
+import time
+from src.Lex import Lexer
+
+
+def keywords(n: int, seed: int = 0) -> list:
+    generator = random.Random(seed)
+    words = set()
+    while len(words) < n:
+        words.add("".join(generator.choice(string.ascii_lowercase) for _ in range(generator.randint(3, 8))))
+    return sorted(words)
+
+
+def main():
+    print("%10s %12s %12s %12s %12s" % ("keywords", "states", "build (s)", "minimized", "build (s)"))
+    for n in [10, 20, 40, 80, 160, 320]:
+        spec = {word.upper(): word for word in keywords(n)}
+        spec["ID"] = "[a-z]+"
+        spec["SPACE"] = "' '"
+        start = time.perf_counter()
+        lexer = Lexer(spec)
+        elapsed = time.perf_counter() - start
+        start = time.perf_counter()
+        minimized = Lexer(spec, minimize=True)
+        elapsed_minimized = time.perf_counter() - start
+        print("%10d %12d %12.3f %12d %12.3f" % (n, lexer.dfa.n_states, elapsed, minimized.dfa.n_states,
+                                                  elapsed_minimized))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+The DFA of (a|b)*a(a|b){n} has about 2^n states: the eager lexer takes time and memory exponential in n to build,
+while the lazy one is ready at once and only builds the states a sample input reaches, keeping at most 1024 of them.
+With a state budget of 1024 the eager lexer gives up on the DFA and simulates the NFA instead.
+
+Run from the root of the repository: python -m benchmarks.bench_lazy
+"""
+import random
+import time
+from src.Lex import Lexer
+
+
+def main():
+    generator = random.Random(0)
+    print("%4s %12s %12s %12s %12s %12s %12s" % ("n", "eager (s)", "states", "lazy (s)", "lex (s)", "evictions",
+                                                  "nfa lex (s)"))
+    for n in [4, 8, 10, 12, 14, 16, 20]:
+        spec = {"WORD": "(a|b)*a" + "(a|b)" * n, "SPACE": "' '"}
+        word = " ".join("".join(generator.choice("ab") for _ in range(50)) + "a" + "b" * n for _ in range(200))
+        if n <= 12:
+            start = time.perf_counter()
+            eager = Lexer(spec)
+            eager_time = time.perf_counter() - start
+            states = eager.dfa.n_states
+        else:
+            eager_time = float("nan")
+            states = 0
+        start = time.perf_counter()
+        lazy = Lexer(spec, lazy=True, max_states=1024)
+        lazy_time = time.perf_counter() - start
+        start = time.perf_counter()
+        lazy.lex(word)
+        lex_time = time.perf_counter() - start
+        budget = Lexer(spec, state_budget=1024)
+        start = time.perf_counter()
+        budget.lex(word)
+        budget_time = time.perf_counter() - start
+        print("%4d %12.3f %12d %12.4f %12.3f %12d %12.3f" % (n, eager_time, states, lazy_time, lex_time,
+                                                             lazy.dfa.evictions, budget_time))
+
+
+if __name__ == "__main__":
+    main()
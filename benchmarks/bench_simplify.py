@@ -0,0 +1,58 @@
+"""
+Building the DFA of a specification written the way specifications often are: keywords listed as alternatives,
+classes spelled out as unions of characters, nested and counted loops. Each regex is built as it is parsed and after
+simplify_tree, the table gives the NFA states of each one and the time the subset construction and the compilation of the DFA take.
+
+Run from the root of the repository: python -m benchmarks.bench_simplify
+"""
+import time
+from src.DFA import DFA
+from src.NFA import NFA
+from src.Parser import Parser
+from src.Simplify import simplify_tree, thompson_states
+
+
+def build(trees) -> tuple:
+    """
+    @return: The tuple (seconds, states of the DFA) of the DFA of the union of the trees.
+    """
+    nfas = [NFA(tree) for tree in trees]
+    main_nfa = nfas[0]
+    for nfa in nfas[1:]:
+        nfa.graph.is_start_state = False
+        main_nfa.graph.insert_graph(nfa.graph, "eps")
+        for char in nfa.alphabet:
+            main_nfa.add_char_in_alphabet(char)
+        main_nfa.states.update(nfa.states)
+    start = time.perf_counter()
+    dfa = DFA.fromNFA(main_nfa).compile()
+    return time.perf_counter() - start, dfa.n_states
+
+
+def main():
+    letter = "(" + "|".join("abcdefghijklmnopqrstuvwxyz_") + ")"
+    digit = "(" + "|".join("0123456789") + ")"
+    keywords = ["auto", "break", "case", "char", "const", "continue", "default", "do", "double", "else", "enum",
+                "extern", "float", "for", "goto", "if", "int", "long", "register", "return", "short", "signed",
+                "sizeof", "static", "struct", "switch", "typedef", "union", "unsigned", "void", "volatile", "while"]
+    spec = {
+        "KEYWORD": "|".join(keywords),
+        "ID": letter + "(" + letter + "|" + digit + ")*",
+        "NUMBER": "(" + digit + "+)*(.(" + digit + "*)?)?",
+        "HEX": "0x((" + digit + "|a|b|c|d|e|f){1,}){1}",
+        "SPACE": "(' '|'\n'|'\t')+",
+    }
+    spec["NUMBER"] = spec["NUMBER"].replace(".", "'.'")
+    print("%10s %12s %12s" % ("token", "states", "simplified"))
+    trees = [Parser.toTree(regex) for regex in spec.values()]
+    simplified = [simplify_tree(tree) for tree in trees]
+    for token, tree, small in zip(spec, trees, simplified):
+        print("%10s %12d %12d" % (token, thompson_states(tree), thompson_states(small)))
+    print()
+    print("%10s %12s %12s" % ("", "dfa (s)", "dfa states"))
+    print("%10s %12.3f %12d" % ("as parsed", *build(trees)))
+    print("%10s %12.3f %12d" % ("simplified", *build(simplified)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""
+Lexing a multilingual UTF-8 file: decoding it and lexing the text with a lexer over characters, against lexing its
+bytes in place with a UTF-8 lexer (utf8=True), whose table has at most 256 classes whatever the classes of the
+specification.
+
+Run from the root of the repository: python -m benchmarks.bench_utf8
+"""
+import random
+import time
+from src.Lex import Lexer
+
+
+def main():
+    spec = {
+        "LATIN": "[a-zA-Zà-ÿ]+",
+        "GREEK": "[α-ω]+",
+        "CJK": "[一-鿿]+",
+        "NUMBER": "[0-9]+",
+        "SPACE": "[ \n]+",
+        "OTHER": "[^a-zA-Zà-ÿα-ω一-鿿0-9 \n]",
+    }
+    generator = random.Random(0)
+    words = ["lexer", "façade", "naïve", "λόγος", "αβγ", "词法分析", "中文", "2024", "😀", "€", ",", "!"]
+    text = " ".join(generator.choice(words) for _ in range(200000))
+    data = text.encode()
+
+    print("%8s %10s %12s %12s" % ("engine", "classes", "build (s)", "lex (s)"))
+    start = time.perf_counter()
+    lexer = Lexer(spec)
+    build = time.perf_counter() - start
+    start = time.perf_counter()
+    lexer.lex_offsets(data.decode())
+    print("%8s %10d %12.3f %12.3f" % ("chars", lexer.dfa.n_classes, build, time.perf_counter() - start))
+
+    start = time.perf_counter()
+    lexer = Lexer(spec, utf8=True)
+    build = time.perf_counter() - start
+    start = time.perf_counter()
+    lexer.lex_bytes(data)
+    print("%8s %10d %12.3f %12.3f" % ("utf8", lexer.dfa.n_classes, build, time.perf_counter() - start))
+
+
+if __name__ == "__main__":
+    main()
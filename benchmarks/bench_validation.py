@@ -0,0 +1,40 @@
+"""
+Validation of short patterns: time to build the matcher of a regex and to check a few words with it, for the DFA
+(subset construction), the NFA simulation and the bit-parallel Glushkov matcher.
+
+Run from the root of the repository: python -m benchmarks.bench_validation
+"""
+import time
+from src.DFA import DFA
+from src.Glushkov import Glushkov
+from src.NFA import NFA
+from src.Parser import Parser
+
+
+def _time(build, prenex, words, repeat=20):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        matcher = build(prenex)
+        for word in words:
+            matcher.accepts(word)
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    cases = [
+        ("[a-z]([a-z]|[0-9])*", ["user42", "x", "4ever", "a" * 60]),
+        ("[0-9]+", ["0", "123456789", "12a"]),
+        ("[A-Z][A-Z][A-Z]([0-9][0-9][0-9][0-9])", ["ABC1234", "AB12345", "XYZ0000"]),
+        ("([0-9]+)|(0x([0-9]|[a-f])+)", ["1234", "0xdeadbeef", "0x"]),
+    ]
+    print("%42s %10s %12s %12s %12s" % ("regex", "positions", "dfa (ms)", "nfa (ms)", "glushkov (ms)"))
+    for regex, words in cases:
+        prenex = Parser.toPrenex(regex)
+        positions = Glushkov.fromPrenex(prenex).n_positions
+        print("%42s %10d %12.3f %12.3f %12.3f" % (regex, positions, _time(DFA.fromPrenex, prenex, words) * 1e3,
+                                                  _time(NFA.fromPrenex, prenex, words) * 1e3,
+                                                  _time(Glushkov.fromPrenex, prenex, words) * 1e3))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+from __future__ import annotations
+from bisect import bisect_right
+from typing import Dict, Iterable, List, Tuple
+
+# The largest code point, the characters of a negated class are taken up to it.
+MAX_CODE_POINT = 0x10FFFF
+# The characters written as they are in the prenex form of a class, the others are escaped.
+_PLAIN = frozenset(chr(code) for code in range(0x21, 0x7F)) - set("'\\[]-^")
+
+
+class CharSet:
+    """
+    A set of characters stored as sorted, disjoint and non adjacent intervals (low, high) of code points, both ends
+    included. A class of a regex is a single label of the NFA, however many characters it holds.
+    """
+    __slots__ = ("intervals",)
+
+    def __init__(self, intervals: Iterable[Tuple[int, int]]):
+        """
+        @param intervals: Intervals of code points, in any order, they may overlap.
+        """
+        merged = []
+        for low, high in sorted(intervals):
+            if len(merged) > 0 and low <= merged[-1][1] + 1:
+                if high > merged[-1][1]:
+                    merged[-1] = (merged[-1][0], high)
+            else:
+                merged.append((low, high))
+        self.intervals = tuple(merged)
+
+    @staticmethod
+    def fromToken(token: str) -> CharSet:
+        """
+        @param token: The prenex form of a class, as written by str.
+        @return: Returns the class.
+        """
+        chars = []
+        i = 1
+        negated = token[1] == "^"
+        if negated:
+            i += 1
+        while i < len(token) - 1:
+            if token[i] == "\\":
+                digits = {"x": 2, "u": 4, "U": 8}[token[i + 1]]
+                chars.append(int(token[i + 2:i + 2 + digits], 16))
+                i += 2 + digits
+            elif token[i] == "-":
+                chars.append(None)
+                i += 1
+            else:
+                chars.append(ord(token[i]))
+                i += 1
+        intervals = []
+        j = 0
+        while j < len(chars):
+            if j + 2 < len(chars) and chars[j + 1] is None:
+                intervals.append((chars[j], chars[j + 2]))
+                j += 3
+            else:
+                intervals.append((chars[j], chars[j]))
+                j += 1
+        char_set = CharSet(intervals)
+        return char_set.negate() if negated else char_set
+
+    def negate(self) -> CharSet:
+        """
+        @return: The characters, up to MAX_CODE_POINT, that are not in the set.
+        """
+        intervals = []
+        low = 0
+        for start, end in self.intervals:
+            if start > low:
+                intervals.append((low, start - 1))
+            low = end + 1
+        if low <= MAX_CODE_POINT:
+            intervals.append((low, MAX_CODE_POINT))
+        return CharSet(intervals)
+
+    def label(self) -> CharSet | str:
+        """
+        @return: The character of the set if it holds a single one, the set otherwise.
+        """
+        if len(self.intervals) == 1 and self.intervals[0][0] == self.intervals[0][1]:
+            return chr(self.intervals[0][0])
+        return self
+
+    def __contains__(self, char: str) -> bool:
+        i = bisect_right(self.intervals, (ord(char), MAX_CODE_POINT)) - 1
+        return i >= 0 and self.intervals[i][1] >= ord(char)
+
+    def __len__(self) -> int:
+        return sum(high - low + 1 for low, high in self.intervals)
+
+    def __eq__(self, other):
+        if isinstance(other, CharSet):
+            return self.intervals == other.intervals
+        return False
+
+    def __hash__(self):
+        return hash(self.intervals)
+
+    def __str__(self) -> str:
+        """
+        @return: The prenex form of the set, e.g. [0-9a-f], or [^...] followed by the characters that are not in the
+        set if it ends with MAX_CODE_POINT. It holds neither spaces nor quotes, the characters outside _PLAIN are
+        escaped as \\xhh, \\uhhhh or \\Uhhhhhhhh.
+        """
+        intervals = self.intervals
+        prefix = "["
+        if len(intervals) > 0 and intervals[-1][1] == MAX_CODE_POINT:
+            intervals = self.negate().intervals
+            prefix = "[^"
+        items = []
+        for low, high in intervals:
+            items.append(_escape(low) if low == high else _escape(low) + "-" + _escape(high))
+        return prefix + "".join(items) + "]"
+
+    def __repr__(self):
+        return "CharSet(" + str(self) + ")"
+
+
+# The class . of a regex, every character but the newline.
+DOT = CharSet([(0, ord("\n") - 1), (ord("\n") + 1, MAX_CODE_POINT)])
+
+
+def _escape(code: int) -> str:
+    """
+    @return: The character of the code point, as written in the prenex form of a class.
+    """
+    char = chr(code)
+    if char in _PLAIN:
+        return char
+    if code < 0x100:
+        return "\\x%02x" % code
+    if code < 0x10000:
+        return "\\u%04x" % code
+    return "\\U%08x" % code
+
+
+def intervals(label: CharSet | str) -> Tuple[Tuple[int, int], ...]:
+    """
+    @param label: A label of the NFA, a character or a set of characters.
+    @return: The intervals of code points of the label.
+    """
+    if isinstance(label, CharSet):
+        return label.intervals
+    return (ord(label), ord(label)),
+
+
+class ClassMap(dict):
+    """
+    Maps a character to its class. The code points are split into segments, starts[i] being the first code point of
+    segment i and segment_classes[i] its class: class 0 gathers the characters outside the alphabet. The segment of a
+    character is found by a binary search, and its class is then kept in the dict for the next lookups.
+    """
+
+    def __init__(self, starts, segment_classes):
+        super().__init__()
+        self.starts = starts
+        self.segment_classes = segment_classes
+        self.n_classes = max(segment_classes, default=0) + 1
+
+    def __missing__(self, char):
+        char_class = self.segment_classes[bisect_right(self.starts, ord(char)) - 1]
+        self[char] = char_class
+        return char_class
+
+    def __reduce__(self):
+        return ClassMap, (list(self.starts), list(self.segment_classes))
+
+    def renumber(self, renumber: List[int]) -> ClassMap:
+        """
+        @param renumber: The new class of each class, class 0 staying 0.
+        @return: The class map of the new classes.
+        """
+        starts = []
+        segment_classes = []
+        for start, char_class in zip(self.starts, self.segment_classes):
+            char_class = renumber[char_class]
+            if len(segment_classes) == 0 or segment_classes[-1] != char_class:
+                starts.append(start)
+                segment_classes.append(char_class)
+        return ClassMap(starts, segment_classes)
+
+
+def partition(labels: Iterable[CharSet | str]) -> Tuple[ClassMap, Dict[CharSet | str, List[int]]]:
+    """
+    Splits the alphabet into classes of characters that no label tells apart. The code points are cut at the ends of
+    the intervals of the labels, then the segments that are in the same labels get the same class: an automaton
+    built over the labels moves the same way on all the characters of a class, so it can use classes as symbols. The
+    characters in no label are class 0, the other classes are numbered from 1 in the order of their first character.
+    @param labels: The labels of an NFA, characters or sets of characters.
+    @return: A tuple (classes, label_classes): the class map and the classes of each label, in increasing order.
+    """
+    labels = list(labels)
+    bounds = {0}
+    for label in labels:
+        for low, high in intervals(label):
+            bounds.add(low)
+            bounds.add(high + 1)
+    starts = sorted(bounds)
+    index = {start: i for i, start in enumerate(starts)}
+    # The labels each segment is in.
+    members = [[] for _ in starts]
+    label_segments = []
+    for j, label in enumerate(labels):
+        segments = []
+        for low, high in intervals(label):
+            segments.extend(range(index[low], index[high + 1]))
+        for segment in segments:
+            members[segment].append(j)
+        label_segments.append(segments)
+    signatures = {(): 0}
+    segment_classes = []
+    for segment in range(len(starts)):
+        signature = tuple(members[segment])
+        char_class = signatures.get(signature)
+        if char_class is None:
+            char_class = signatures[signature] = len(signatures)
+        segment_classes.append(char_class)
+    label_classes = {label: sorted({segment_classes[segment] for segment in segments})
+                     for label, segments in zip(labels, label_segments)}
+    # The consecutive segments of the same class are merged, fewer segments make the binary search shorter.
+    merged_starts = []
+    merged_classes = []
+    for start, char_class in zip(starts, segment_classes):
+        if len(merged_classes) == 0 or merged_classes[-1] != char_class:
+            merged_starts.append(start)
+            merged_classes.append(char_class)
+    return ClassMap(merged_starts, merged_classes), label_classes
@@ -1,31 +1,43 @@
 from typing import Generic, TypeVar
-from src.NFA import NFA, Transition, NodeGraph
-import collections
+from src.CharSet import ClassMap, partition
+from src.NFA import NFA, NodeGraph
+from array import array
+import mmap
+import os
+import struct
+import sys
+import uuid
 
 S = TypeVar("S")
 T = TypeVar("T")
 
 
+class DFATooLarge(Exception):
+	"""Raised by the subset construction when the DFA has more states than allowed."""
+
+
 class DFA(Generic[S]):
 	def __init__(self, nfa):
 		self.nfa = nfa
 		self.graph = None
 		self.state_number = 0
 		self.sink = NodeGraph(-1, False, False)
+		# The epsilon closure of every nfa state, computed the first time it is needed.
+		self.closures = {}
+		# The class of every character, the transitions of the dfa are labelled with classes.
+		self.classes = None
 
 	def xNext(self, state: NodeGraph, letter: str):
-		current_state: Transition
-		for current_state in state.adj:
-			if current_state.transition == letter:
-				return current_state.node
-
+		targets = state.moves.get(self.classes[letter])
+		if targets:
+			return targets[0]
 		return self.sink
 
 	def xNextx(self, current_state: NodeGraph, input_char: str) -> NodeGraph:
 		next_state = self.sink
 
 		for transition in current_state.adj:
-			if transition.transition == input_char:
+			if transition.transition == self.classes[input_char]:
 				next_state = transition.node
 				break
 		return next_state
@@ -62,55 +74,85 @@ class DFA(Generic[S]):
 		return a
 
 	@staticmethod
-	def fromNFA(nfa: NFA):
+	def fromNFA(nfa: NFA, max_states: int = None):
 		"""
 		@param nfa: NFA.
+		@param max_states: If given, DFATooLarge is raised as soon as the DFA has more states than max_states.
 		@return: Returns DFA from NFA.
 		"""
 		a = DFA(nfa)
-		a.DFA_Graph()
+		a.DFA_Graph(max_states)
 
 		return a
 
+	def compile(self, tokens=None) -> 'CompiledDFA':
+		"""
+		@param tokens: Token names indexed by lex_rank. A DFA that was not built by the lexer has a single, unnamed token.
+		@return: Returns the frozen, table-driven form of the DFA. The result keeps no reference to the graph (or to the
+		NFA it was built from), so the graph can be released once the DFA is compiled.
+		"""
+		if tokens is None:
+			tokens = [""]
+		# Number the states in the order they are reached, the sink is 0 and the initial state is 1.
+		ids = {self.sink: CompiledDFA.SINK, self.graph: CompiledDFA.START}
+		order = [self.sink, self.graph]
+		i = 1
+		while i < len(order):
+			for targets in order[i].moves.values():
+				if targets[0] not in ids:
+					ids[targets[0]] = len(order)
+					order.append(targets[0])
+			i += 1
+		# Class 0 gathers all the characters outside the alphabet, it always leads to the sink.
+		classes = ClassMap(self.classes.starts, self.classes.segment_classes)
+		n_classes = classes.n_classes
+		table = array("i", [CompiledDFA.SINK]) * (len(order) * n_classes)
+		accept = array("i", [-1]) * len(order)
+		for state in order[1:]:
+			row = ids[state] * n_classes
+			for char_class, targets in state.moves.items():
+				table[row + char_class] = ids[targets[0]]
+			if state.is_final_state:
+				accept[ids[state]] = max(state.lex_rank, 0)
+		return CompiledDFA(classes, n_classes, table, accept, list(tokens)).merge_classes()
+
 	def get_epsilon_states(self, state: NodeGraph, res=None) -> list[NodeGraph]:
 		"""
 		@param state: The initial state.
 		@param res: The list of states to which the states on epsilon transitions will be added
-		@return: Returns all states that can be reached from the current state by epsilon transitions. The method goes
-		recursively on all epsilon transitions from the resulting states.
+		@return: Returns all states that can be reached from the current state by epsilon transitions.
 		"""
 		if res is None:
 			res = []
-		res.append(state)
-		for transition in state.adj:
-			if transition.transition == "eps" and (transition.node not in res):
-				self.get_epsilon_states(transition.node, res)
+		seen = set(res)
+		res.extend(node for node in self.epsilon_closure(state) if node not in seen)
 		return res
 
-	@staticmethod
-	def check_adj(state: NodeGraph, letter):
+	def epsilon_closure(self, state: NodeGraph) -> frozenset:
 		"""
-		@param state: The state for which the letter transition is sought.
-		@param letter: The transition on the letter.
-		@return: Returns true if the state "state" has no transition on the letter "letter", otherwise it returns false.
+		@param state: A state of the nfa.
+		@return: Returns the set of the states that can be reached from state by epsilon transitions, state included.
+		The set is computed once, iteratively (so long chains of epsilon transitions do not hit the recursion limit),
+		and reused by the following calls. The closures computed before are reused while computing a new one.
 		"""
-		for transition in state.adj:
-			if transition.transition == letter:
-				return False
-		return True
-
-	@staticmethod
-	def check_if_visited(visited, states):
-		"""
-
-		@param visited: List of visited states.
-		@param states: List of states.
-		@return: This function checks whether a list of states (states) has already been visited or not.
-		"""
-		for j in visited:
-			if collections.Counter(j.states) == collections.Counter(states):
-				return True
-		return False
+		closure = self.closures.get(state)
+		if closure is not None:
+			return closure
+		closure = {state}
+		to_visit = [state]
+		while len(to_visit) > 0:
+			for target in to_visit.pop().eps:
+				if target in closure:
+					continue
+				known = self.closures.get(target)
+				if known is not None:
+					closure.update(known)
+				else:
+					closure.add(target)
+					to_visit.append(target)
+		closure = frozenset(closure)
+		self.closures[state] = closure
+		return closure
 
 	@staticmethod
 	def is_start_state(node: NodeGraph):
@@ -150,56 +192,53 @@ class DFA(Generic[S]):
 					current_node.lex = state.lex
 					current_node.lex_rank = state.lex_rank
 
-	def DFA_Graph(self):
+	def DFA_Graph(self, max_states: int = None):
 		# Add to the initial state from dfa all the states from nfa that can be traversed by epsilon transitions from
 		# the initial state.
-		current_state = self.get_epsilon_states(self.nfa.graph, [])
+		start = self.epsilon_closure(self.nfa.graph)
 		# The first state of the dfa with the number 0 is created.
 		graph = NodeGraph(self.state_number, False, False)
 		self.state_number += 1
-		graph.add_states(current_state)
+		graph.add_states(start)
+		# Every set of nfa states found so far, with the state of the dfa made of it: a set is looked up in O(1)
+		# instead of being compared with all the visited states.
+		subsets = {start: graph}
+		# The labels of the nfa are split into classes of characters, see partition.
+		self.classes, label_classes = partition(self.nfa.alphabet)
 		visited = []
 		to_visit = [graph]
 		while len(to_visit) > 0:
 			# The current state is deleted from to_visit and added to visited.
 			current_state = to_visit.pop()
 			visited.append(current_state)
-			# All the letters of the alphabet are scrolled.
-			for letter in self.nfa.alphabet:
-				states_per_letter = set()
-				# For all the states in nfa from which the state in dfa is formed.
-				for states in current_state.states:
-					# Add to states_per_letter all the states we can reach from the states in nfa that make up the state
-					# in dfa per letter "letter".
-					for adj_states in states.adj:
-						if adj_states.transition == letter:
-							states_per_letter.add(adj_states.node)
-					aux = set()
-					# The states on epsilon transitions from each of the states found are also added.
-					for i in states_per_letter:
-						tmp = (self.get_epsilon_states(i, []))
-						aux.update(tmp)
-					states_per_letter.update(aux)
-
-					if len(states_per_letter) == 0:
-						# If none of the states in nfa from which the state in dfa is made up has a letter transition,
-						# then the current state in dfa will have a transition to sink.
-						if states == list(current_state.states)[len(current_state.states) - 1] and self.check_adj(current_state, letter):
-							current_state.insert_graph(self.sink, letter)
-					elif states == list(current_state.states)[len(current_state.states) - 1]:
-						# If the newly formed state that should be in dfa has neither been visited nor should be visited,
-						# then the new state is created and added to to_visit.
-						if not self.check_if_visited(visited, states_per_letter) and states_per_letter not in to_visit:
-							new_state = NodeGraph(self.state_number, False, False)
-							new_state.add_states(states_per_letter)
-							self.state_number += 1
-							to_visit.append(new_state)
-							current_state.insert_graph(new_state, letter)
-						else:
-							# A transition is created for the new state formed for dfa on the letter "letter".
-							for j in visited:
-								if collections.Counter(j.states) == collections.Counter(states_per_letter):
-									current_state.insert_graph(j, letter)
+			# All the states we can reach from the states in nfa that make up the state in dfa per class, and then
+			# by epsilon transitions. Only the classes of the labels of these states are looked at, the other classes
+			# lead to the sink, which is what xNext returns for a missing transition.
+			moves = {}
+			for states in current_state.states:
+				for label, targets in states.moves.items():
+					closure = self.epsilon_closure(targets[0])
+					for target in targets[1:]:
+						closure = closure | self.epsilon_closure(target)
+					for letter in label_classes[label]:
+						states_per_letter = moves.get(letter)
+						if states_per_letter is None:
+							states_per_letter = moves[letter] = set()
+						states_per_letter.update(closure)
+			# The classes are taken in order, so the states are numbered the same on every run.
+			for letter in sorted(moves):
+				states_per_letter = frozenset(moves[letter])
+				new_state = subsets.get(states_per_letter)
+				if new_state is None:
+					# The set was never found before, the new state is created and added to to_visit.
+					if max_states is not None and self.state_number >= max_states:
+						raise DFATooLarge("The DFA has more than " + str(max_states) + " states")
+					new_state = NodeGraph(self.state_number, False, False)
+					new_state.add_states(states_per_letter)
+					self.state_number += 1
+					subsets[states_per_letter] = new_state
+					to_visit.append(new_state)
+				current_state.insert_graph(new_state, letter)
 		# Set the state in dfa if it is start state or end state.
 		for state in visited:
 			state.is_start_state = self.is_start_state(state)
@@ -207,3 +246,355 @@ class DFA(Generic[S]):
 			self.is_lexer(state, state)
 		visited.append(self.sink)
 		self.graph = visited[0]
+
+
+class CompiledDFA:
+	"""
+	Frozen, table-driven form of a DFA. States are integers (0 is the sink and 1 the initial state), characters are
+	mapped to classes and the transitions are stored in a flat array indexed by state * n_classes + class. Each state
+	also stores the id of the token it accepts, or -1 if it is not final.
+	Bytes are lexed as Latin-1 characters, byte_classes maps each of the 256 byte values to its class.
+
+	The tables can be saved in a binary format (see to_bytes) and loaded back from a memory-mapped file without being
+	copied, so that all the processes using the same file share its pages.
+	"""
+	SINK = 0
+	START = 1
+	MAGIC = b"LEXDFA\0\0"
+	VERSION = 2
+	# Written in native byte order, tells whether a file was saved on a machine with the same byte order.
+	BYTE_ORDER = 0x01020304
+	# magic, version, byte order, number of states, of classes, of segments in the class map and of tokens.
+	HEADER = struct.Struct("8s6I")
+
+	def __init__(self, classes: ClassMap, n_classes: int, table, accept, tokens: list, path: str = None):
+		self.classes = classes
+		self.n_classes = n_classes
+		self.n_states = len(accept)
+		self.table = table
+		self.accept = accept
+		self.tokens = tokens
+		self.byte_classes = array("i", [classes[chr(byte)] for byte in range(256)])
+		# The file the tables are mapped from, if any.
+		self.path = path
+
+	def to_bytes(self) -> bytes:
+		"""
+		@return: The binary form of the DFA: the header, then the transition table, the accepted token ids, the
+		first code point of each segment of the class map and their classes (all int32), the lengths of the token
+		names and the UTF-8 encoded names. Every section starts at a multiple of 4 bytes.
+		"""
+		names = [token.encode() for token in self.tokens]
+		return b"".join([
+			self.HEADER.pack(self.MAGIC, self.VERSION, self.BYTE_ORDER, self.n_states, self.n_classes, len(self.classes.starts), len(names)),
+			array("i", self.table).tobytes(),
+			array("i", self.accept).tobytes(),
+			array("i", self.classes.starts).tobytes(),
+			array("i", self.classes.segment_classes).tobytes(),
+			array("i", [len(name) for name in names]).tobytes(),
+		] + names)
+
+	@staticmethod
+	def from_buffer(buffer, path: str = None) -> 'CompiledDFA':
+		"""
+		@param buffer: The binary form of a DFA (bytes, mmap...), the tables are read from it without being copied.
+		@param path: The file buffer is mapped from, if any.
+		@return: Returns the DFA. Raises ValueError if buffer does not hold a DFA saved by this version on a machine
+		with the same byte order.
+		"""
+		view = memoryview(buffer).cast("B")
+		if len(view) < CompiledDFA.HEADER.size:
+			raise ValueError("Not a compiled DFA")
+		magic, version, byte_order, n_states, n_classes, n_segments, n_tokens = CompiledDFA.HEADER.unpack_from(view)
+		if magic != CompiledDFA.MAGIC or version != CompiledDFA.VERSION or byte_order != CompiledDFA.BYTE_ORDER:
+			raise ValueError("Not a compiled DFA of version " + str(CompiledDFA.VERSION) + " in " + sys.byteorder + "-endian byte order")
+
+		sizes = [n_states * n_classes, n_states, n_segments, n_segments, n_tokens]
+		if len(view) < CompiledDFA.HEADER.size + 4 * sum(sizes):
+			raise ValueError("Truncated compiled DFA")
+		sections = []
+		offset = CompiledDFA.HEADER.size
+		for size in sizes:
+			sections.append(view[offset:offset + 4 * size].cast("i"))
+			offset += 4 * size
+		table, accept, starts, segment_classes, lengths = sections
+		tokens = []
+		for length in lengths:
+			tokens.append(str(view[offset:offset + length], "utf-8"))
+			offset += length
+		if offset != len(view):
+			raise ValueError("Truncated compiled DFA")
+		classes = ClassMap(starts, segment_classes)
+		return CompiledDFA(classes, n_classes, table, accept, tokens, path)
+
+	def save(self, path: str):
+		"""
+		Writes the binary form of the DFA to a file. The file is written next to its final path then renamed, so
+		that a process never maps a file that is only partly written. Each writer has its own temporary file, the
+		threads and processes that save the same DFA at once each replace the file with a complete copy.
+		@param path: The path of the file.
+		"""
+		temporary = path + "." + uuid.uuid4().hex + ".tmp"
+		try:
+			with open(temporary, "xb") as file:
+				file.write(self.to_bytes())
+			os.replace(temporary, path)
+		except BaseException:
+			if os.path.exists(temporary):
+				os.remove(temporary)
+			raise
+
+	@staticmethod
+	def load(path: str) -> 'CompiledDFA':
+		"""
+		@param path: A file written by save.
+		@return: Returns the DFA, its tables are memory-mapped from the file.
+		"""
+		with open(path, "rb") as file:
+			buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+		return CompiledDFA.from_buffer(buffer, path)
+
+	def __reduce__(self):
+		# Memoryviews cannot be pickled: a mapped DFA is sent as its path, the others as their binary form.
+		if self.path is not None:
+			return CompiledDFA.load, (self.path,)
+		return CompiledDFA.from_buffer, (self.to_bytes(),)
+
+	def minimize(self) -> 'CompiledDFA':
+		"""
+		Merges the equivalent states with Hopcroft's partition refinement. The states start split by the token they
+		accept (-1 for the states that are not final), and the sink is kept alone in its block: a state that cannot
+		reach a final state anymore is not merged with the sink, so match stops at the same position as before.
+		@return: Returns an equivalent DFA with the smallest number of states, and the classes that became equivalent
+		merged (see merge_classes).
+		"""
+		n_states = self.n_states
+		n_classes = self.n_classes
+		table = self.table
+		# The states leading to each state by each class.
+		sources = [{} for _ in range(n_classes)]
+		for state in range(1, n_states):
+			row = state * n_classes
+			for char_class in range(n_classes):
+				sources[char_class].setdefault(table[row + char_class], []).append(state)
+
+		groups = {}
+		for state in range(1, n_states):
+			groups.setdefault(self.accept[state], []).append(state)
+		blocks = [{self.SINK}] + [set(group) for group in groups.values()]
+		block_of = [0] * n_states
+		for i, block in enumerate(blocks):
+			for state in block:
+				block_of[state] = i
+		waiting = list(range(len(blocks)))
+		is_waiting = [True] * len(blocks)
+		while len(waiting) > 0:
+			splitter = waiting.pop()
+			is_waiting[splitter] = False
+			targets = list(blocks[splitter])
+			for char_class in range(n_classes):
+				# The states of each block that go to the splitter by char_class.
+				touched = {}
+				for target in targets:
+					for state in sources[char_class].get(target, ()):
+						touched.setdefault(block_of[state], []).append(state)
+				for i, states in touched.items():
+					block = blocks[i]
+					if len(states) == len(block):
+						continue
+					# Block i is split, the states that go to the splitter move to a new block.
+					block.difference_update(states)
+					new = len(blocks)
+					blocks.append(set(states))
+					for state in states:
+						block_of[state] = new
+					# Only the smaller half has to be used as a splitter if block i already was one.
+					if is_waiting[i] or len(states) < len(block):
+						waiting.append(new)
+						is_waiting.append(True)
+					else:
+						waiting.append(i)
+						is_waiting[i] = True
+						is_waiting.append(False)
+
+		# Number the blocks in the order they are reached, the sink is 0 and the initial state is 1.
+		ids = {block_of[self.SINK]: self.SINK, block_of[self.START]: self.START}
+		order = [self.SINK, self.START]
+		i = 1
+		while i < len(order):
+			row = order[i] * n_classes
+			for char_class in range(n_classes):
+				block = block_of[table[row + char_class]]
+				if block not in ids:
+					ids[block] = len(order)
+					order.append(table[row + char_class])
+			i += 1
+		new_table = array("i", [self.SINK]) * (len(order) * n_classes)
+		new_accept = array("i", [-1]) * len(order)
+		for state in order[1:]:
+			row = ids[block_of[state]] * n_classes
+			for char_class in range(n_classes):
+				new_table[row + char_class] = ids[block_of[table[state * n_classes + char_class]]]
+			new_accept[ids[block_of[state]]] = self.accept[state]
+		return CompiledDFA(self.classes, n_classes, new_table, new_accept, list(self.tokens)).merge_classes()
+
+	def merge_classes(self) -> 'CompiledDFA':
+		"""
+		Merges the classes that have the same column in the table: all the states move the same way on them, so the
+		characters of these classes do not need to be told apart. A class that always leads to the sink is merged
+		with class 0.
+		@return: Returns an equivalent DFA, self if no classes can be merged.
+		"""
+		n_classes = self.n_classes
+		columns = {}
+		renumber = []
+		for char_class in range(n_classes):
+			column = tuple(self.table[char_class::n_classes])
+			renumber.append(columns.setdefault(column, len(columns)))
+		if len(columns) == n_classes:
+			return self
+		table = array("i", [self.SINK]) * (self.n_states * len(columns))
+		for char_class in range(n_classes):
+			table[renumber[char_class]::len(columns)] = array("i", self.table[char_class::n_classes])
+		return CompiledDFA(self.classes.renumber(renumber), len(columns), table, self.accept, list(self.tokens))
+
+	def accepts(self, string: str) -> bool:
+		"""
+		@param string: String to check.
+		@return: Returns true if the string is accepted and false if it is not.
+		"""
+		table = self.table
+		n_classes = self.n_classes
+		lookup = self.classes.__getitem__
+		state = self.START
+		for char in string:
+			state = table[state * n_classes + lookup(char)]
+			if state == self.SINK:
+				return False
+		return self.accept[state] >= 0
+
+	def match(self, word, position: int, lookup=None):
+		"""
+		Runs the DFA on word starting at position, until it reaches the sink or the end of the word.
+		@param word: The word to be lexed, a string or a memoryview of bytes.
+		@param position: The position where the lexeme starts.
+		@param lookup: Maps an element of word to its class, classes.__getitem__ by default.
+		@return: A tuple (token, end, stop): the id of the token of the longest lexeme (-1 if no lexeme was accepted),
+		the position where that lexeme ends and the position of the character that led to the sink (len(word) if the
+		end of the word was reached first).
+		"""
+		table = self.table
+		accept = self.accept
+		n_classes = self.n_classes
+		if lookup is None:
+			lookup = self.classes.__getitem__
+		state = self.START
+		token = -1
+		end = position
+		length = len(word)
+		i = position
+		while i < length:
+			state = table[state * n_classes + lookup(word[i])]
+			if state == 0:
+				# The sink, no longer lexeme can be found.
+				return token, end, i
+			i += 1
+			if accept[state] >= 0:
+				token = accept[state]
+				end = i
+		return token, end, length
+
+	def match_linear(self, word, position: int, failed: dict, lookup=None):
+		"""
+		Same as match, but remembers the (state, position) pairs from which no lexeme can be accepted anymore, so that
+		a later call reaching one of them stops right away (Reps' tabulation). Every pair fails at most once, hence
+		lexing a whole word takes O(len(word) * n_states) steps instead of O(len(word) ** 2).
+		@param word: The word to be lexed.
+		@param position: The position where the lexeme starts.
+		@param failed: Shared by all the calls on the same word, maps a failed pair to the stop position it leads to.
+		@param lookup: Maps an element of word to its class, classes.__getitem__ by default.
+		@return: The same tuple (token, end, stop) as match.
+		"""
+		table = self.table
+		accept = self.accept
+		n_classes = self.n_classes
+		n_states = self.n_states
+		if lookup is None:
+			lookup = self.classes.__getitem__
+		state = self.START
+		token = -1
+		end = position
+		length = len(word)
+		stop = length
+		# The pairs visited since the last accepted lexeme, they fail if no other lexeme is accepted.
+		path = []
+		i = position
+		while i < length:
+			state = table[state * n_classes + lookup(word[i])]
+			if state == 0:
+				stop = i
+				break
+			i += 1
+			key = i * n_states + state
+			if key in failed:
+				stop = failed[key]
+				break
+			if accept[state] >= 0:
+				token = accept[state]
+				end = i
+				path.clear()
+			else:
+				path.append(key)
+		for key in path:
+			failed[key] = stop
+		return token, end, stop
+
+	def scan(self, word, position: int = 0, limit: int = None, lookup=None, failed: dict = None):
+		"""
+		Splits word into the longest lexemes, starting at position, until a lexeme starts at limit or later.
+		@param word: The word to be lexed, a string or a memoryview of bytes.
+		@param position: The position where the first lexeme starts.
+		@param limit: No lexeme starting at limit or later is returned, len(word) by default.
+		@param lookup: Maps an element of word to its class, classes.__getitem__ by default.
+		@param failed: If given, the scan memoizes failures as match_linear does.
+		@return: A tuple (lexemes, stop): the list of tuples (token, start, end) that were found and the stop position
+		of match for the first position from where no lexeme can be found, or -1 if there is no such position.
+		"""
+		length = len(word)
+		if limit is None:
+			limit = length
+		lexemes = []
+		append = lexemes.append
+		if failed is not None:
+			while position < limit:
+				token, end, stop = self.match_linear(word, position, failed, lookup)
+				if token < 0:
+					return lexemes, stop
+				append((token, position, end))
+				position = end
+			return lexemes, -1
+
+		# Same as calling match for every lexeme, inlined since this is the hot loop of the lexer.
+		table = self.table
+		accept = self.accept
+		n_classes = self.n_classes
+		if lookup is None:
+			lookup = self.classes.__getitem__
+		while position < limit:
+			state = self.START
+			token = -1
+			end = position
+			i = position
+			while i < length:
+				state = table[state * n_classes + lookup(word[i])]
+				if state == 0:
+					break
+				i += 1
+				if accept[state] >= 0:
+					token = accept[state]
+					end = i
+			if token < 0:
+				return lexemes, i
+			append((token, position, end))
+			position = end
+		return lexemes, -1
@@ -0,0 +1,156 @@
+from __future__ import annotations
+from typing import Dict, List
+
+from src.CharSet import CharSet, partition
+from src.NFA import NodeTree, create_tree, is_repetition, repetition_tree, _string_split
+from src.Parser import Parser
+
+
+class Glushkov:
+    """
+    Bit-parallel matcher of the position (Glushkov) automaton of a regex. Every occurrence of a character in the regex
+    is a position, numbered from 1 (bit 0 is the initial state), and a set of positions is an int. Reading a character
+    keeps, among the positions that can follow the current ones, those of that character: the positions that follow a
+    set are found with one table lookup per 8 positions, so a character costs a handful of integer operations for the
+    short regexes this is meant for, and nothing has to be built but the tables.
+    """
+    # Above this number of positions, a DFA is the better choice.
+    MAX_POSITIONS = 512
+    # Number of positions per lookup table.
+    CHUNK = 8
+
+    def __init__(self, masks: Dict[CharSet | str, int], follow: List[int], final: int):
+        """
+        @param masks: The set of the positions of each label, a character or a CharSet.
+        @param follow: The set of the positions that can follow each position, the first positions following bit 0.
+        @param final: The set of the positions that can end a word, bit 0 if the empty word is accepted.
+        """
+        # The positions of each class of characters (see partition), none for class 0.
+        self.classes, label_classes = partition(masks)
+        self.masks = [0] * self.classes.n_classes
+        for label, positions in masks.items():
+            for char_class in label_classes[label]:
+                self.masks[char_class] |= positions
+        self.final = final
+        self.n_positions = len(follow) - 1
+        # tables[j][byte] is the set of the positions following the positions 8 * j + i for the bits i of byte. Each
+        # position doubles the table, the entries with its bit being the ones without it plus its follow set, so the
+        # last table only covers the positions that are left: a regex of 3 positions needs 16 entries, not 256.
+        self.tables = []
+        for j in range(0, len(follow), self.CHUNK):
+            table = [0]
+            for position in range(j, min(j + self.CHUNK, len(follow))):
+                following = follow[position]
+                table += [entry | following for entry in table]
+            self.tables.append(table)
+
+    @staticmethod
+    def fromPrenex(string: str) -> Glushkov:
+        """
+        @param string: Prenex.
+        @return: Returns the matcher of the prenex. Raises ValueError if it has more than MAX_POSITIONS positions.
+        """
+        return Glushkov.fromTree(create_tree(_string_split(string)))
+
+    @staticmethod
+    def fromRegex(regex: str) -> Glushkov:
+        """
+        @param regex: Regex, in the syntax of the lexer configurations.
+        @return: Returns the matcher of the regex.
+        """
+        return Glushkov.fromTree(Parser.toTree(regex))
+
+    @staticmethod
+    def fromTree(tree: NodeTree) -> Glushkov:
+        """
+        @param tree: The tree of a regex or a prenex, as built by Parser.toTree or create_tree.
+        @return: Returns the matcher of the tree. A subtree used several times (as in a counted repetition) gets its
+        own positions for each use.
+        """
+        masks = {}
+        follow = [0]
+        # The tuples (nullable, first, last) of the subtrees visited, in post-order.
+        results = []
+        to_visit = [(tree, False)]
+        while len(to_visit) > 0:
+            node, visited = to_visit.pop()
+            while is_repetition(node.data):
+                # x{1} is x itself, which may be a repetition too.
+                node = repetition_tree(node)
+            data = node.data
+            if isinstance(data, CharSet) or len(data) == 1:
+                # A character or a class: a new position. The classes are not compared with the operators below.
+                if len(follow) > Glushkov.MAX_POSITIONS:
+                    raise ValueError("The regex has more than " + str(Glushkov.MAX_POSITIONS) + " positions")
+                bit = 1 << len(follow)
+                follow.append(0)
+                masks[data] = masks.get(data, 0) | bit
+                results.append((False, bit, bit))
+                continue
+            if not visited and data in ("UNION", "CONCAT", "STAR", "PLUS", "MAYBE"):
+                to_visit.append((node, True))
+                # The left operand of a binary node is the second one, it is visited last.
+                if node.left is not None:
+                    to_visit.append((node.left, False))
+                to_visit.append((node.right, False))
+                continue
+
+            if data == "CONCAT":
+                nullable2, first2, last2 = results.pop()
+                nullable1, first1, last1 = results.pop()
+                for position in _positions(last1):
+                    follow[position] |= first2
+                results.append((nullable1 and nullable2, first1 | first2 if nullable1 else first1,
+                                last1 | last2 if nullable2 else last2))
+            elif data == "UNION":
+                nullable2, first2, last2 = results.pop()
+                nullable1, first1, last1 = results.pop()
+                results.append((nullable1 or nullable2, first1 | first2, last1 | last2))
+            elif data in ("STAR", "PLUS", "MAYBE"):
+                nullable, first, last = results.pop()
+                if data != "MAYBE":
+                    for position in _positions(last):
+                        follow[position] |= first
+                results.append((nullable or data != "PLUS", first, last))
+            elif data == "eps":
+                results.append((True, 0, 0))
+            elif data == "void":
+                results.append((False, 0, 0))
+
+        nullable, first, last = results.pop()
+        follow[0] = first
+        return Glushkov(masks, follow, last | 1 if nullable else last)
+
+    def accepts(self, string: str) -> bool:
+        """
+        @param string: String to check.
+        @return: Returns true if the string is accepted and false if it is not.
+        """
+        tables = self.tables
+        masks = self.masks
+        classes = self.classes
+        chunk = self.CHUNK
+        mask = (1 << chunk) - 1
+        current = 1
+        for char in string:
+            following = 0
+            j = 0
+            while current:
+                following |= tables[j][current & mask]
+                current >>= chunk
+                j += 1
+            current = following & masks[classes[char]]
+            if current == 0:
+                return False
+        return current & self.final != 0
+
+
+def _positions(bits: int):
+    """
+    @param bits: A set of positions.
+    @return: The positions of the set, in increasing order.
+    """
+    while bits:
+        low = bits & -bits
+        bits ^= low
+        yield low.bit_length() - 1
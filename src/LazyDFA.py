@@ -0,0 +1,305 @@
+from __future__ import annotations
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+from src.CharSet import ClassMap, partition
+from src.NFA import NFA
+
+
+class _LazyState:
+    """
+    A state of the lazy DFA: a set of NFA states, the token it accepts (-1 if it is not final) and the transitions
+    found so far, by class of characters. next is None once the state was evicted from the cache.
+    """
+    __slots__ = ("nfa_states", "accept", "next")
+
+    def __init__(self, nfa_states: frozenset, accept: int):
+        self.nfa_states = nfa_states
+        self.accept = accept
+        self.next = {}
+
+
+class LazyDFA:
+    """
+    DFA built on the fly from an NFA: a state (a set of NFA states) is only built the first time the input reaches
+    it, and each transition is computed the first time it is taken. Lexing can start as soon as the NFA is built,
+    and only the part of the DFA that the input needs is ever built.
+
+    At most max_states states are kept. When a new state is needed and the cache is full, the least recently used
+    state is evicted with its transitions, it is built again from its NFA states if the input reaches it later.
+
+    The NFA is stored as flat lists indexed by state, the initial state being 0: moves maps each class of characters
+    (see partition) to the targets, eps holds the targets of the epsilon transitions and final the token id of the
+    final states (-1 for the other states). The transitions of the DFA are cached by class, so a state holds at most
+    one transition per class whatever the characters of the input. The DFA has the same interface as CompiledDFA
+    (match, match_linear, scan), except that the elements of the word are mapped to characters instead of classes.
+    """
+    # The Latin-1 character of every byte value, lex_bytes maps the bytes of the input with it.
+    byte_classes = [chr(byte) for byte in range(256)]
+
+    def __init__(self, classes: ClassMap, moves: List[Dict[int, Tuple[int, ...]]], eps: List[Tuple[int, ...]],
+                 final: List[int], tokens: list, max_states: int = 4096):
+        if max_states < 2:
+            raise ValueError("max_states must be at least 2, not " + str(max_states))
+        self.classes = classes
+        self.moves = moves
+        self.eps = eps
+        self.final = final
+        self.tokens = tokens
+        self.max_states = max_states
+        # The epsilon closure of every NFA state, computed the first time it is needed.
+        self.closures = [None] * len(final)
+        # The states of the DFA by set of NFA states, from the least to the most recently used. The sink is not
+        # stored, it is never evicted.
+        self.cache = OrderedDict()
+        self.sink = _LazyState(frozenset(), -1)
+        self.start = self._intern(self._closure(0))
+        self.evictions = 0
+        # The cache is changed at every step, the threads that share the DFA match one lexeme at a time.
+        self.lock = threading.Lock()
+
+    @classmethod
+    def fromNFA(cls, nfa: NFA, tokens: list = None, max_states: int = 4096) -> LazyDFA:
+        """
+        @param nfa: NFA, its final states hold the rank of their token in lex_rank (or -1 if it is not a lexer NFA).
+        @param tokens: Token names indexed by lex_rank, a single unnamed token by default.
+        @param max_states: The maximum number of states that are kept.
+        @return: Returns the lazy DFA of the NFA. Only the NFA is traversed, no state of the DFA is built yet but
+        the initial one.
+        """
+        classes, label_classes = partition(nfa.alphabet)
+        ids = {nfa.graph: 0}
+        order = [nfa.graph]
+        moves = []
+        eps = []
+        final = []
+        i = 0
+        while i < len(order):
+            node = order[i]
+            for target in [*node.eps, *(target for targets in node.moves.values() for target in targets)]:
+                if target not in ids:
+                    ids[target] = len(order)
+                    order.append(target)
+            move = {}
+            for label, targets in node.moves.items():
+                for char_class in label_classes[label]:
+                    move[char_class] = move.get(char_class, ()) + tuple(ids[target] for target in targets)
+            moves.append(move)
+            eps.append(tuple(ids[target] for target in node.eps))
+            final.append(max(node.lex_rank, 0) if node.is_final_state else -1)
+            i += 1
+        return cls(classes, moves, eps, final, [""] if tokens is None else list(tokens), max_states)
+
+    @property
+    def n_states(self) -> int:
+        """
+        @return: The number of states built and not evicted, the sink included.
+        """
+        return len(self.cache) + 1
+
+    def __reduce__(self):
+        # The states are left out, they are built again by the copy.
+        return type(self), (self.classes, self.moves, self.eps, self.final, self.tokens, self.max_states)
+
+    def _closure(self, state: int) -> frozenset:
+        """
+        @param state: A state of the NFA.
+        @return: The states of the NFA that can be reached from state by epsilon transitions, state included.
+        """
+        closure = self.closures[state]
+        if closure is not None:
+            return closure
+        closure = {state}
+        to_visit = [state]
+        while len(to_visit) > 0:
+            for target in self.eps[to_visit.pop()]:
+                if target not in closure:
+                    closure.add(target)
+                    to_visit.append(target)
+        closure = frozenset(closure)
+        self.closures[state] = closure
+        return closure
+
+    def _accept(self, nfa_states: frozenset) -> int:
+        """
+        @return: The id of the token accepted by the set of NFA states, the smallest one if several tokens are, or -1.
+        """
+        accept = -1
+        for nfa_state in nfa_states:
+            token = self.final[nfa_state]
+            if token >= 0 and (accept < 0 or token < accept):
+                accept = token
+        return accept
+
+    def _move(self, nfa_states: frozenset, char_class: int) -> frozenset:
+        """
+        @return: The NFA states reached from nfa_states by a character of char_class, and then by epsilon transitions.
+        """
+        targets = set()
+        for nfa_state in nfa_states:
+            for move in self.moves[nfa_state].get(char_class, ()):
+                targets.update(self._closure(move))
+        return frozenset(targets)
+
+    def _intern(self, nfa_states: frozenset) -> _LazyState:
+        """
+        @param nfa_states: A set of NFA states closed under epsilon transitions.
+        @return: The state of the DFA made of nfa_states, built if it is not in the cache. The state becomes the most
+        recently used one.
+        """
+        if len(nfa_states) == 0:
+            return self.sink
+        state = self.cache.get(nfa_states)
+        if state is not None:
+            self.cache.move_to_end(nfa_states)
+            return state
+        state = _LazyState(nfa_states, self._accept(nfa_states))
+        self.cache[nfa_states] = state
+        while len(self.cache) > self.max_states:
+            _, evicted = self.cache.popitem(last=False)
+            evicted.next = None
+            self.evictions += 1
+        return state
+
+    def step(self, state: _LazyState, char: str) -> _LazyState:
+        """
+        @param state: A state of the DFA that was not evicted.
+        @param char: A character.
+        @return: The state reached from state by char, built if needed.
+        """
+        char_class = self.classes[char]
+        target = state.next.get(char_class)
+        if target is None or target.next is None:
+            if target is None:
+                nfa_states = self._move(state.nfa_states, char_class)
+            else:
+                # The target was evicted since the transition was found.
+                nfa_states = target.nfa_states
+            target = self._intern(nfa_states)
+            state.next[char_class] = target
+        elif target is not self.sink:
+            self.cache.move_to_end(target.nfa_states)
+        return target
+
+    def _start(self) -> _LazyState:
+        if self.start.next is None:
+            self.start = self._intern(self.start.nfa_states)
+        else:
+            self.cache.move_to_end(self.start.nfa_states)
+        return self.start
+
+    def accepts(self, string: str) -> bool:
+        """
+        @param string: String to check.
+        @return: Returns true if the string is accepted and false if it is not.
+        """
+        with self.lock:
+            state = self._start()
+            for char in string:
+                state = self.step(state, char)
+                if state is self.sink:
+                    return False
+            return state.accept >= 0
+
+    def match(self, word, position: int, lookup=None):
+        """
+        Same as CompiledDFA.match.
+        @param word: The word to be lexed, a string or a memoryview of bytes.
+        @param position: The position where the lexeme starts.
+        @param lookup: Maps an element of word to its character, the elements of a string are used as they are.
+        @return: A tuple (token, end, stop), see CompiledDFA.match.
+        """
+        with self.lock:
+            sink = self.sink
+            step = self.step
+            state = self._start()
+            token = -1
+            end = position
+            length = len(word)
+            i = position
+            while i < length:
+                state = step(state, word[i] if lookup is None else lookup(word[i]))
+                if state is sink:
+                    return token, end, i
+                i += 1
+                if state.accept >= 0:
+                    token = state.accept
+                    end = i
+            return token, end, length
+
+    def match_linear(self, word, position: int, failed: dict, lookup=None):
+        """
+        Same as CompiledDFA.match_linear, the failed pairs are keyed by the NFA states of the DFA state, which stay
+        the same if the state is evicted and built again.
+        """
+        with self.lock:
+            sink = self.sink
+            step = self.step
+            state = self._start()
+            token = -1
+            end = position
+            length = len(word)
+            stop = length
+            path = []
+            i = position
+            while i < length:
+                state = step(state, word[i] if lookup is None else lookup(word[i]))
+                if state is sink:
+                    stop = i
+                    break
+                i += 1
+                key = (i, state.nfa_states)
+                if key in failed:
+                    stop = failed[key]
+                    break
+                if state.accept >= 0:
+                    token = state.accept
+                    end = i
+                    path.clear()
+                else:
+                    path.append(key)
+            for key in path:
+                failed[key] = stop
+            return token, end, stop
+
+    def scan(self, word, position: int = 0, limit: int = None, lookup=None, failed: dict = None):
+        """
+        Same as CompiledDFA.scan.
+        """
+        if limit is None:
+            limit = len(word)
+        lexemes = []
+        while position < limit:
+            if failed is not None:
+                token, end, stop = self.match_linear(word, position, failed, lookup)
+            else:
+                token, end, stop = self.match(word, position, lookup)
+            if token < 0:
+                return lexemes, stop
+            lexemes.append((token, position, end))
+            position = end
+        return lexemes, -1
+
+
+class NFASimulation(LazyDFA):
+    """
+    Runs the NFA on sets of states, as LazyDFA does, but keeps no state of the DFA: each character costs a pass over
+    the current set of NFA states, and the memory used is bounded by the size of the NFA whatever the input. The
+    lexer falls back to it when the DFA has more states than its budget allows.
+    """
+
+    @property
+    def n_states(self) -> int:
+        return 1
+
+    def _intern(self, nfa_states: frozenset) -> _LazyState:
+        if len(nfa_states) == 0:
+            return self.sink
+        return _LazyState(nfa_states, self._accept(nfa_states))
+
+    def step(self, state: _LazyState, char: str) -> _LazyState:
+        return self._intern(self._move(state.nfa_states, self.classes[char]))
+
+    def _start(self) -> _LazyState:
+        return self.start
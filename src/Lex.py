@@ -1,25 +1,110 @@
 from __future__ import annotations
 from src.NFA import NFA
-from src.DFA import DFA
+from src.DFA import DFA, CompiledDFA, DFATooLarge
+from src.LazyDFA import LazyDFA, NFASimulation
 from src.Parser import Parser
+from src.Simplify import simplify_tree, thompson_states
+from src.Tokens import TokenColumns
+from src.Utf8 import utf8_tree
 
-from typing import Tuple, List, Dict
+import hashlib
+import json
+import mmap
+import os
+import sys
+import tempfile
+from array import array
+from bisect import bisect_left
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from itertools import islice
+from typing import Tuple, List, Dict, Iterable, Iterator, TextIO
 
 def _gel_line(position, word):
-    j = 0
-    for i in range(position):
-        if word[i].endswith("\n"):
-            j += 1
+    return word.count("\n", 0, max(position, 0))
 
-    return j
+def _count_lines(position: int, data: memoryview) -> int:
+    """
+    Same as _gel_line for a memoryview of bytes, the newlines are counted a block at a time so that only one block
+    is copied at once.
+    """
+    block = 1 << 20
+    lines = 0
+    for i in range(0, position, block):
+        lines += bytes(data[i:min(i + block, position)]).count(b"\n")
+    return lines
+
+def _no_viable_alternative(stop: int, word, base: int = 0, lines: int = 0) -> str:
+    """
+    The message of the error found at position stop of word (len(word) if the end of the input was reached), word
+    being the part of the input that starts at offset base, after lines newlines.
+    """
+    count = _gel_line if isinstance(word, str) else _count_lines
+    if stop == len(word):
+        return "No viable alternative at character EOF, line " + str(lines + count(len(word) - 1, word))
+    return "No viable alternative at character " + str(base + stop) + ", line " + str(lines + count(stop, word))
 
-def error_lexer(position, word):
-    j = _gel_line(position, word)
-    if position == len(word):
-        return "No viable alternative at character EOF, line " + str(len(word) - 1)
+# The DFA and the word shared by the processes of lex_parallel, set once per process by _init_worker.
+_worker = None
+
+# The format of the code units of the text written by lex_parallel, by number of bytes per character.
+_UNIT_FORMATS = {1: "B", 2: "H", 4: "I"}
+
+def _init_worker(dfa, path, width, linear):
+    """
+    Memory-maps the text written by lex_parallel, its characters being read as code units of width bytes: the pages
+    of the file are shared by the processes, each one only reads the part it lexes.
+    """
+    global _worker
+    with open(path, "rb") as file:
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    word = memoryview(buffer).cast(_UNIT_FORMATS[width])
+    if width == 1:
+        lookup = dfa.byte_classes.__getitem__
+    elif isinstance(dfa, LazyDFA):
+        lookup = chr
     else:
-        return "No viable alternative at character " + str(position) + ", line " + str(j)
+        classes = dfa.classes
+        lookup = lambda code: classes[chr(code)]
+    _worker = (dfa, word, lookup, linear)
+
+def _lex_chunk(start: int, limit: int):
+    """
+    Lexes the word of the process speculatively from start, as if a lexeme started there, until a lexeme starts at
+    limit or later.
+    @return: The token ids, starts and ends of the lexemes (as arrays, which are cheap to send back) and the stop
+    position of the scan (-1 if no error was found).
+    """
+    dfa, word, lookup, linear = _worker
+    offsets, stop = dfa.scan(word, start, limit, lookup, {} if linear else None)
+    return (array("i", [token for token, _, _ in offsets]), array("q", [begin for _, begin, _ in offsets]),
+            array("q", [end for _, _, end in offsets]), stop)
+
+# The lexer of the processes started by lex_many, set once per process by _init_batch_worker.
+_batch_lexer = None
+
+def _init_batch_worker(lexer):
+    global _batch_lexer
+    _batch_lexer = lexer
+
+def _lex_batch(words: List[str], lexer=None) -> list:
+    if lexer is None:
+        lexer = _batch_lexer
+    return [lexer.lex(word) for word in words]
+
+def _cache_key(configurations: Dict[str, str], minimize: bool = False, utf8: bool = False) -> str:
+    """
+    The name of the cache file of a configuration: a hash of the tokens and their regexes, in order, of the version
+    of the binary format and of whether the DFA is minimized and reads UTF-8.
+    """
+    text = json.dumps([CompiledDFA.VERSION, minimize, utf8, list(configurations.items())])
+    return hashlib.sha256(text.encode()).hexdigest()
+
 
+class LexerError(Exception):
+    """
+        Raised when the input cannot be lexed, the message is the one lex would return.
+    """
 
 
 class Lexer:
@@ -29,13 +114,89 @@ class Lexer:
         The configuration is passed as a dictionary TOKEN -> REGEX
 
         You are encouraged to use the functions from the past stages to parse the regexes
+
+        With linear=True the lexer never rescans the input in a way that can lead to quadratic time: the (state,
+        position) pairs that did not lead to a lexeme are memoized, so lexing takes O(n) steps at the cost of some
+        extra memory. The tokens and the error messages are the same in both modes.
+
+        If cache_dir is given, the compiled DFA is saved there in a file named after a hash
+        of the configuration, and the next lexers built with the same configuration map
+        that file instead of compiling the regexes again. If the file cannot be written, the
+        compiled DFA is used from memory.
+
+        With minimize=True the equivalent states of the DFA are merged (see CompiledDFA.minimize), the tokens are
+        the same but the tables are smaller. stats holds the number of states of the DFA that is used and, if the
+        regexes were compiled, the number of states before minimization.
+
+        With lazy=True the DFA is not compiled: its states are built while lexing, the first
+        time the input reaches them, and at most max_states of them are kept (see LazyDFA).
+        The lexer is ready as soon as the NFA is built and the tokens are the same, lexing is
+        slower until the states the input needs are built. A lazy DFA cannot be minimized or
+        saved in cache_dir.
+
+        If state_budget is given and the DFA has more states than that, its construction is
+        stopped and the lexer simulates the NFA instead (see NFASimulation): the memory used
+        stays bounded and the tokens are the same, but every character is slower to lex.
+        stats["engine"] tells which engine is used: "dfa", "lazy" or "nfa".
+
+        With utf8=True the automaton reads the UTF-8 encoding of the text, one byte at a time:
+        every character and class of the regexes is compiled into the byte sequences of its
+        encodings (see utf8_tree), so the table has at most 256 classes however wide the
+        classes are, and lex_bytes and lex_file lex UTF-8 without decoding it. lex, lex_offsets,
+        lex_positions and lex_columns encode the text and return character offsets as usual,
+        lex_parallel and lex_iter are not supported.
     """
 
-    def __init__(self, configurations: Dict[str, str]) -> None:
+    def __init__(self, configurations: Dict[str, str], linear: bool = False, cache_dir: str = None,
+                 minimize: bool = False, lazy: bool = False, max_states: int = 4096,
+                 state_budget: int = None, utf8: bool = False) -> None:
+        self.tokens = list(configurations)
+        self.linear = linear
+        self.utf8 = utf8
+        self.minimize = minimize
+        self.state_budget = state_budget
+        self.stats = {"engine": "dfa"}
+        if lazy:
+            if cache_dir is not None or minimize:
+                raise ValueError("A lazy DFA cannot be saved in cache_dir or minimized")
+            self.dfa = LazyDFA.fromNFA(self._build_nfa(configurations), self.tokens, max_states)
+            self.stats["engine"] = "lazy"
+            self.stats["nfa_states"] = len(self.dfa.final)
+            return
+        if cache_dir is not None:
+            path = os.path.join(cache_dir, _cache_key(configurations, minimize, utf8) + ".lexdfa")
+            try:
+                self.dfa = CompiledDFA.load(path)
+                self.stats["states"] = self.dfa.n_states
+                return
+            except (OSError, ValueError):
+                # Missing, or written by another version: compile the DFA again and replace the file.
+                pass
+
+        self.dfa = self._compile(configurations)
+        if cache_dir is not None and isinstance(self.dfa, CompiledDFA):
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                self.dfa.save(path)
+                self.dfa = CompiledDFA.load(path)
+            except OSError:
+                # The cache cannot be written or read back: the DFA is already compiled, it is kept in memory.
+                pass
+
+    def _build_nfa(self, configurations: Dict[str, str]) -> NFA:
+        """
+        @return: The NFA of all the tokens: the NFA of each regex, its final state holding the rank of the token, is
+        linked to the initial state of the first one by an epsilon transition. Each regex is simplified first (see
+        simplify_tree), stats["simplified"] maps each token to the number of states of its NFA before and after.
+        """
         nfas = []
+        self.stats["simplified"] = {}
 
         for i, lex in enumerate(configurations):
-            nfa = NFA.fromPrenex(Parser.toPrenex(configurations[lex]))
+            tree = Parser.toTree(configurations[lex])
+            simplified = simplify_tree(tree)
+            self.stats["simplified"][lex] = (thompson_states(tree), thompson_states(simplified))
+            nfa = NFA(utf8_tree(simplified) if self.utf8 else simplified)
             nfa.graph.final_state.lex = lex
             nfa.graph.final_state.lex_rank = i
             nfas.append(nfa)
@@ -45,10 +206,31 @@ class Lexer:
         for nfa in nfas[1:]:
             nfa.graph.is_start_state = False
             main_nfa.graph.insert_graph(nfa.graph, "eps")
-            main_nfa.alphabet.extend(set(nfa.alphabet) - set(main_nfa.alphabet))
+            for char in nfa.alphabet:
+                main_nfa.add_char_in_alphabet(char)
             main_nfa.states.update(nfa.states)
+        return main_nfa
 
-        self.dfa = DFA.fromNFA(main_nfa)
+    def _compile(self, configurations: Dict[str, str]) -> CompiledDFA | NFASimulation:
+        nfa = self._build_nfa(configurations)
+        try:
+            # Only the compiled tables are kept, the NFA and DFA graphs are released.
+            dfa = DFA.fromNFA(nfa, self.state_budget).compile(self.tokens)
+        except DFATooLarge:
+            self.stats["engine"] = "nfa"
+            simulation = NFASimulation.fromNFA(nfa, self.tokens)
+            self.stats["nfa_states"] = len(simulation.final)
+            return simulation
+        self.stats["subset_states"] = dfa.n_states
+        if self.minimize:
+            dfa = dfa.minimize()
+        self.stats["states"] = dfa.n_states
+        return dfa
+
+    def _matcher(self, lookup=None):
+        if self.linear:
+            return partial(self.dfa.match_linear, failed={}, lookup=lookup)
+        return partial(self.dfa.match, lookup=lookup)
 
     """
         The main functionality of the lexer, receives a word and lexes it
@@ -59,50 +241,281 @@ class Lexer:
     """
 
     def lex(self, word: str) -> List[Tuple[str, str]] | str:
+        offsets = self.lex_offsets(word)
+        if isinstance(offsets, str):
+            return offsets
+
+        tokens = self.tokens
+        return [(tokens[token], word[start:end]) for token, start, end in offsets]
+
+    """
+        Same as lex, but the tokens are returned as tuples (TOKEN_ID, START, END), where
+        TOKEN_ID indexes self.tokens and the lexeme is word[START:END], so no lexeme is
+        built unless the caller asks for it.
+    """
+
+    def lex_offsets(self, word: str) -> List[Tuple[int, int, int]] | str:
+        if self.utf8:
+            return self._lex_utf8(word)
+        offsets, stop = self._scan(word)
+        if stop >= 0:
+            return _no_viable_alternative(stop, word)
+        return offsets
+
+    def _lex_utf8(self, word: str) -> List[Tuple[int, int, int]] | str:
+        """
+        lex_offsets for a UTF-8 lexer: the word is encoded and lexed as bytes, then the byte offsets are turned back
+        into character offsets. A lexeme is made of whole characters, its length is the one of its decoding.
+        """
+        data = word.encode()
+        offsets, stop = self._scan(data, self.dfa.byte_classes.__getitem__)
+        if stop >= 0:
+            # The character of the byte the lexer stopped at, the bytes of that character before it are ignored.
+            return _no_viable_alternative(len(data[:stop].decode(errors="ignore")) if stop < len(data) else len(word),
+                                          word)
+        if len(data) == len(word):
+            return offsets
+        result = []
+        position = 0
+        for token, start, end in offsets:
+            length = len(data[start:end].decode())
+            result.append((token, position, position + length))
+            position += length
+        return result
+
+    def _scan(self, word, lookup=None):
+        return self.dfa.scan(word, lookup=lookup, failed={} if self.linear else None)
+
+    """
+        Same as lex, but each tuple also holds the line and the column where the lexeme
+        starts (TOKEN, LEXEM, LINE, COLUMN), both counted from 0 as in the error messages.
+    """
+
+    def lex_positions(self, word: str) -> List[Tuple[str, str, int, int]] | str:
+        offsets = self.lex_offsets(word)
+        if isinstance(offsets, str):
+            return offsets
+
         final_list = []
-        state = self.dfa.graph
-        string = str()
-        previous_string = str()
-        previous_token = str()
-        counter = -1
-        previous_i = -1
-        while True:
-            counter += 1
-            if counter == len(word):
-                if previous_i == counter - 1:
-                    break
-                if not (len(previous_string) == 0):
-                    string = str()
-                    final_list.append((previous_token, previous_string))
-                    state = self.dfa.graph
-                    counter = previous_i + 1
-                else:
-                    return "No viable alternative at character EOF, line " + str(_gel_line(len(word) - 1, word))
-
-
-            state = self.dfa.xNextx(state, word[counter])
-
-            string += word[counter]
-            if not (len(state.lex) == 0):
-                previous_i = counter
-                previous_string = str(string)
-                previous_token = state.lex
-            elif len(previous_string) != 0 and len(previous_token) != 0:
-                if state == self.dfa.sink:
-                    string = str()
-                    counter = previous_i
-                    final_list.append((previous_token, previous_string))
-                    previous_string = str()
-                    state = self.dfa.graph
+        tokens = self.tokens
+        line = column = 0
+        for token, start, end in offsets:
+            final_list.append((tokens[token], word[start:end], line, column))
+            # Move to the end of the lexeme, only its own characters are looked at.
+            newlines = word.count("\n", start, end)
+            if newlines:
+                line += newlines
+                column = end - word.rfind("\n", start, end) - 1
             else:
-                if state == self.dfa.sink:
-                    return error_lexer(counter, word)
+                column += end - start
+
+        return final_list
 
+    """
+        Same as lex_offsets, but the tokens are returned as a TokenColumns: the token ids,
+        start and end offsets are stored in parallel arrays, the names being self.tokens.
+        The word is scanned a block at a time, so no list of tuples for the whole word is
+        built on the way.
+    """
+
+    def lex_columns(self, word: str, block: int = 1 << 16) -> TokenColumns | str:
+        columns = TokenColumns(self.tokens, word)
+        if self.utf8:
+            offsets = self._lex_utf8(word)
+            if isinstance(offsets, str):
+                return offsets
+            columns.extend(offsets)
+            return columns
+        failed = {} if self.linear else None
+        position = 0
+        while position < len(word):
+            offsets, stop = self.dfa.scan(word, position, min(position + block, len(word)), failed=failed)
+            if stop >= 0:
+                return _no_viable_alternative(stop, word)
+            columns.extend(offsets)
+            position = offsets[-1][2]
 
+        return columns
+
+    """
+        Same as lex, but the word is split into chunks that are lexed in parallel by a
+        pool of worker processes.
 
-        if len(previous_string) != 0 or len(previous_token) != 0:
-            final_list.append((previous_token, previous_string))
-        elif previous_i == 0:
-            return error_lexer(counter, word)
+        Every chunk but the first one is lexed speculatively, as if a lexeme started at
+        its first character. The chunks are then stitched in order: the lexemes of a chunk
+        are kept from the first one that starts where the lexemes of the previous chunks
+        end, since from there on the sequential lexer finds exactly the same lexemes. If
+        there is no such lexeme, the chunk is lexed again from there until it synchronizes.
+        The result (errors included) is the same as the one of lex.
+
+        The word is not sent to the workers: it is written once to a temporary file, with
+        1, 2 or 4 bytes per character depending on its largest one, that every worker
+        memory-maps. Whatever the start method of the processes, the text is in memory
+        once, and a worker only reads its chunk and the lookahead past it.
+    """
+
+    def lex_parallel(self, word: str, workers: int = None, chunks: int = None) -> List[Tuple[str, str]] | str:
+        if self.utf8:
+            raise ValueError("lex_parallel does not support UTF-8 lexers")
+        workers = workers or os.cpu_count() or 1
+        chunks = chunks or 4 * workers
+        size = -(-len(word) // chunks) if word else 1
+        bounds = list(range(0, len(word), size)) + [len(word)]
+        if workers == 1 or len(bounds) <= 2:
+            return self.lex(word)
+
+        largest = max(word)
+        width = 1 if largest < "\u0100" else 2 if largest < "\U00010000" else 4
+        encoding = {1: "latin-1", 2: "utf-16-", 4: "utf-32-"}[width] + ("" if width == 1 else sys.byteorder[0] + "e")
+        descriptor, path = tempfile.mkstemp(suffix=".txt")
+        try:
+            with os.fdopen(descriptor, "wb") as file:
+                # surrogatepass: a lone surrogate is a single code unit too.
+                file.write(word.encode(encoding, "surrogatepass"))
+            with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(self.dfa, path, width, self.linear)) as pool:
+                final_list = self._stitch(word, bounds, pool.map(_lex_chunk, bounds[:-1], bounds[1:]))
+        finally:
+            os.remove(path)
+        return final_list
+
+    def _stitch(self, word: str, bounds: List[int], results) -> List[Tuple[str, str]] | str:
+        """
+        Stitches the results of _lex_chunk on the chunks between bounds, in order, into the result of lex on word.
+        """
+        final_list = []
+        tokens = self.tokens
+        match = self._matcher()
+        position = 0
+        for start, limit, (kinds, starts, ends, stop) in zip(bounds, bounds[1:], results):
+            if position >= limit:
+                # A lexeme of the previous chunks covers the whole chunk.
+                continue
+            # Lex sequentially until position is the start of one of the speculative lexemes.
+            i = bisect_left(starts, position)
+            while (i == len(starts) or starts[i] != position) and position < limit:
+                token, end, error = match(word, position)
+                if token < 0:
+                    return _no_viable_alternative(error, word)
+                final_list.append((tokens[token], word[position:end]))
+                position = end
+                i = bisect_left(starts, position, i)
+            if position >= limit:
+                continue
+            # In sync: the remaining speculative lexemes are the sequential ones.
+            for j in range(i, len(starts)):
+                final_list.append((tokens[kinds[j]], word[starts[j]:ends[j]]))
+            if stop >= 0:
+                return _no_viable_alternative(stop, word)
+            position = ends[-1]
+
+        return final_list
+
+    """
+        Lexes many words and returns the list of the results of lex, in the order of the
+        words. A word that cannot be lexed gets its error message, the others are lexed
+        anyway.
+
+        The words are sent to the workers in batches of batch_size. The executor is either
+        "thread" or "process", in which case a pool of workers is started and the compiled
+        lexer is sent once to each process, or an Executor the caller manages (the lexer
+        is then sent along with every batch).
+    """
+
+    def lex_many(self, words: Iterable[str], executor: str | Executor = "process", workers: int = None, batch_size: int = 256) -> List[List[Tuple[str, str]] | str]:
+        words = iter(words)
+        batches = iter(lambda: list(islice(words, batch_size)), [])
+        if isinstance(executor, Executor):
+            results = executor.map(partial(_lex_batch, lexer=self), batches)
+            return [result for batch in results for result in batch]
+
+        if executor == "thread":
+            pool = ThreadPoolExecutor(workers)
+            task = partial(_lex_batch, lexer=self)
+        elif executor == "process":
+            pool = ProcessPoolExecutor(workers, initializer=_init_batch_worker, initargs=(self,))
+            task = _lex_batch
+        else:
+            raise ValueError("executor must be \"thread\", \"process\" or an Executor, not " + repr(executor))
+        with pool:
+            return [result for batch in pool.map(task, batches) for result in batch]
+
+    """
+        Lexes a string, a text file object or an iterable of string chunks and yields
+        the tuples (TOKEN, LEXEM) as soon as each lexeme is final.
+
+        Only the text of the lexeme being scanned is kept in memory (and the lookahead
+        needed to decide it is the longest one), so the memory used is bounded by the
+        longest lexeme instead of the size of the input. Raises LexerError with the
+        message lex would return if the input cannot be lexed.
+    """
+
+    def lex_iter(self, source: str | TextIO | Iterable[str], chunk_size: int = 1 << 16) -> Iterator[Tuple[str, str]]:
+        if self.utf8:
+            raise ValueError("lex_iter does not support UTF-8 lexers")
+        if isinstance(source, str):
+            chunks = iter((source,))
+        elif hasattr(source, "read"):
+            chunks = iter(partial(source.read, chunk_size), "")
+        else:
+            chunks = iter(source)
+
+        # The text that was not lexed yet starts at buffer[position], buffer[0] is at offset base in the input
+        # and lines is the number of newlines before it.
+        buffer = ""
+        position = base = lines = 0
+        more = True
+        match = self._matcher()
+        while more or position < len(buffer):
+            token, end, stop = match(buffer, position)
+            if more and stop == len(buffer):
+                # The lexeme might go on in the next chunk. Drop the lexed text and read at least as much text as
+                # is pending, so that a lexeme spanning many chunks is only rescanned a logarithmic number of times.
+                lines += buffer.count("\n", 0, position)
+                base += position
+                pending = [buffer[position:]]
+                size = 0
+                while more and size <= len(pending[0]):
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        more = False
+                    else:
+                        pending.append(chunk)
+                        size += len(chunk)
+                buffer = "".join(pending)
+                position = 0
+                match = self._matcher()
+                continue
+            if token < 0:
+                raise LexerError(_no_viable_alternative(stop, buffer, base, lines))
+            yield self.tokens[token], buffer[position:end]
+            position = end
+
+    """
+        Lexes a bytes-like object (bytes, bytearray, memoryview, mmap) without decoding
+        or copying it, every byte being read as a Latin-1 character, or as a byte of the
+        UTF-8 encoding of the text if the lexer was built with utf8=True.
+
+        The return value is either a List of tuples (TOKEN, START, END), the lexemes being
+        buffer[START:END], or a string message if the lexer fails. The positions in the
+        message are byte offsets.
+    """
+
+    def lex_bytes(self, buffer) -> List[Tuple[str, int, int]] | str:
+        tokens = self.tokens
+        with memoryview(buffer) as view, view.cast("B") as data:
+            offsets, stop = self._scan(data, self.dfa.byte_classes.__getitem__)
+            if stop >= 0:
+                return _no_viable_alternative(stop, data)
+        return [(tokens[token], start, end) for token, start, end in offsets]
+
+    """
+        Memory-maps the file at path and lexes it with lex_bytes, the positions are byte
+        offsets in the file.
+    """
 
-        return final_list
\ No newline at end of file
+    def lex_file(self, path: str) -> List[Tuple[str, int, int]] | str:
+        with open(path, "rb") as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return []
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                return self.lex_bytes(buffer)
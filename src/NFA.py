@@ -1,21 +1,36 @@
-from typing import Generic, TypeVar, Optional
+from types import MappingProxyType
+from typing import Generic, TypeVar, Optional, Tuple
+
+from src.CharSet import CharSet, partition
 
 S = TypeVar("S")
 T = TypeVar("T")
 
 
 class NodeTree:
+    __slots__ = ("left", "right", "data")
+
     def __init__(self, data, right, left):
         self.left = left
         self.right = right
         self.data = data
 
 
+# The moves of the states that have no transition on a symbol yet, shared and read-only.
+_NO_MOVES = MappingProxyType({})
+
+
 class NodeGraph:
+    __slots__ = ("state_number", "states", "moves", "eps", "is_start_state", "is_final_state", "start_state",
+                 "final_state", "lex", "lex_rank")
+
     def __init__(self, state_number, is_start_state, is_final_state):
         self.state_number = state_number
-        self.states = []
-        self.adj = []
+        self.states = ()
+        # The targets of each symbol and the targets of the epsilon transitions. Most states have no transition on a
+        # symbol and at most two epsilon transitions: the containers are only created with the first transition.
+        self.moves = _NO_MOVES
+        self.eps = ()
         self.is_start_state = is_start_state
         self.is_final_state = is_final_state
         self.start_state = None
@@ -33,31 +48,23 @@ class NodeGraph:
         @param node: The node on which the transition is passed.
         @param transition: Transition.
         """
-        self.adj.append(Transition(node, transition))
-
-    def update_final_state(self, node):
-        """
-        For each node in the graph, the final state is recursively updated.
-        @param node: Final state node.
-        """
-        if self.final_state != node.final_state:
-            self.final_state = node.final_state
-            for i in range(len(self.adj)):
-                self.adj[i].node.update_final_state(node)
+        if transition == "eps":
+            if len(self.eps) == 0:
+                self.eps = [node]
+            else:
+                self.eps.append(node)
+        elif len(self.moves) == 0:
+            self.moves = {transition: [node]}
         else:
-            return
+            self.moves.setdefault(transition, []).append(node)
 
-    def update_start_state(self, node):
+    @property
+    def adj(self) -> list:
         """
-        For each node in the graph, the start state is recursively updated.
-        @param node: Start state node.
+        @return: The transitions of the state, the epsilon ones first. They are built from moves and eps at each call.
         """
-        if self.start_state != node.start_state:
-            self.start_state = node.start_state
-            for i in range(len(self.adj)):
-                self.adj[i].node.update_start_state(node)
-        else:
-            return
+        return [Transition(node, "eps") for node in self.eps] + [
+            Transition(node, label) for label, targets in self.moves.items() for node in targets]
 
     def add_states(self, states):
         """
@@ -68,6 +75,8 @@ class NodeGraph:
 
 
 class Transition:
+    __slots__ = ("node", "transition")
+
     def __init__(self, node: NodeGraph, transition):
         self.node = node
         self.transition = transition
@@ -79,6 +88,8 @@ class NFA(Generic[S]):
         self.state_number = 0
         self.alphabet = []
         self.states = set()
+        # The tables used by accepts, built on its first call.
+        self._tables = None
         self.graph = self.NFA_Graph(tree)
 
     def getStates(self) -> 'set[S]':
@@ -89,34 +100,72 @@ class NFA(Generic[S]):
 
     def accepts(self, string: str) -> bool:
         """
+        Runs the NFA on all its paths at once (Thompson's simulation): the current states are a list of state ids,
+        every character moves all of them, then the states reached are closed under epsilon transitions. A state is
+        added at most once per character, so every character costs at most one pass over the NFA, whatever the
+        regex. The tables are built on the first call, the NFA must not be changed afterwards.
         @param string: String to check.
         @return: Returns true if the string is accepted and false if it is not.
         """
-        return self._accept(string, self.graph)
-
-    def _accept(self, string: str, graph: NodeGraph) -> bool:
-        """Internal function used to check recursive"""
-        if string == "" and graph.is_final_state:
-            return True
-        if string != "":
-            mylist = []
-            for i in range(len(graph.adj)):
-                if graph.adj[i].transition == string[0]:
-                    mylist.append(graph.adj[i].node)
-            mylist = list(dict.fromkeys(mylist))
-            for i in range(len(mylist)):
-                if self._accept(string[1:], mylist[i]):
-                    return True
-        mylist = []
-        for i in range(len(graph.adj)):
-            if graph.adj[i].transition == "eps":
-                mylist.append(graph.adj[i].node)
-        mylist = list(dict.fromkeys(mylist))
-
-        for i in range(len(mylist)):
-            if self._accept(string, mylist[i]):
-                return True
-        return False
+        if self._tables is None:
+            self._tables = self._build_tables()
+        classes, moves, eps, final = self._tables
+        # seen[state] is the number of the last step that added state.
+        seen = [-1] * len(final)
+        seen[0] = 0
+        current = [0]
+        step = 0
+        while True:
+            # Close the states of the step under epsilon transitions, the list grows while it is read.
+            i = 0
+            while i < len(current):
+                for target in eps[current[i]]:
+                    if seen[target] != step:
+                        seen[target] = step
+                        current.append(target)
+                i += 1
+            if step == len(string):
+                return any(final[state] for state in current)
+            char_class = classes[string[step]]
+            step += 1
+            following = []
+            for state in current:
+                for target in moves[state].get(char_class, ()):
+                    if seen[target] != step:
+                        seen[target] = step
+                        following.append(target)
+            if len(following) == 0:
+                return False
+            current = following
+
+    def _build_tables(self) -> tuple:
+        """
+        Numbers the states in the order they are reached from the initial state, which gets the id 0.
+        @return: A tuple (classes, moves, eps, final): the class map of the labels (see partition), then lists indexed
+        by state id: a dict mapping each class to the ids of the targets, the ids of the targets of the epsilon
+        transitions and whether the state is final.
+        """
+        classes, label_classes = partition(self.alphabet)
+        ids = {self.graph: 0}
+        order = [self.graph]
+        i = 0
+        while i < len(order):
+            node = order[i]
+            for target in [*node.eps, *(target for targets in node.moves.values() for target in targets)]:
+                if target not in ids:
+                    ids[target] = len(order)
+                    order.append(target)
+            i += 1
+        moves = []
+        for node in order:
+            move = {}
+            for label, targets in node.moves.items():
+                for char_class in label_classes[label]:
+                    move.setdefault(char_class, []).extend(ids[target] for target in targets)
+            moves.append(move)
+        eps = [[ids[target] for target in node.eps] for node in order]
+        final = [node.is_final_state for node in order]
+        return classes, moves, eps, final
 
     def isFinal(self, state: S) -> bool:
         pass
@@ -132,116 +181,163 @@ class NFA(Generic[S]):
 
     def add_char_in_alphabet(self, char: str):
         """
-        Add a character to the alphabet.
-        @param char: The character to be added.
+        Add a label, a character or a CharSet, to the alphabet.
+        @param char: The label to be added.
         """
         if char in self.alphabet:
             return
         self.alphabet.append(char)
 
-    def _update_links(self, start_state: NodeGraph, final_state: NodeGraph, node_tree):
-        graph = self.NFA_Graph(node_tree)
-        graph.is_start_state = False
-        graph.final_state.is_final_state = False
-        start_state.insert_graph(graph, "eps")
-        graph.final_state.insert_graph(final_state, "eps")
-        graph.update_final_state(final_state)
-        graph.update_start_state(start_state)
-        return graph
-
     def NFA_Graph(self, node_tree: NodeTree) -> Optional[NodeGraph]:
         """
+        Thompson's construction, in one pass over the tree: the subtrees are visited in post-order with an explicit
+        stack, and each one leaves the pair (initial state, final state) of its graph on a stack of fragments, so
+        that linking the fragments takes O(1) and deep trees do not hit the recursion limit.
         @param node_tree: Tree.
-        @return: The initial state of the graph.
+        @return: The initial state of the graph, its final_state is the final state of the graph.
         """
         if node_tree.data is None:
             return None
-        elif node_tree.data == "void":
-            return NodeGraph(-1, False, False)
-        elif node_tree.data == "eps":
-            self.state_number += 2
-            aux = NodeGraph(self.state_number - 2, True, False)
-            tmp = NodeGraph(self.state_number - 1, False, True)
-
-            self.states.add(aux)
-            self.states.add(tmp)
-
-            aux.insert_graph(tmp, "eps")
-            aux.final_state = tmp
-            return aux
-        elif node_tree.data == "CONCAT":
-            left_graph = self.NFA_Graph(node_tree.left)
-            left_graph.is_start_state = False
-
-            right_graph = self.NFA_Graph(node_tree.right)
-            right_graph.final_state.is_final_state = False
-            right_graph.final_state.insert_graph(left_graph, "eps")
-            right_graph.update_final_state(left_graph)
-            return right_graph
-        elif node_tree.data == "UNION":
-            q = NodeGraph(self.state_number, True, False)
-            f = NodeGraph(self.state_number + 1, False, True)
-
-            self.states.add(q)
-            self.states.add(f)
-            q.update_final_state(f)
-
+        return self._thompson(node_tree)
+
+    def _thompson(self, node_tree: NodeTree) -> NodeGraph:
+        states = self.states
+        # The fragments, as two stacks: their initial states and their final states.
+        starts = []
+        finals = []
+        # An operator is pushed a second time, behind None, to be linked once its operands are built.
+        to_visit = [node_tree]
+        while len(to_visit) > 0:
+            node = to_visit.pop()
+            if node is None:
+                node = to_visit.pop()
+                data = node.data
+            else:
+                data = node.data
+                if data in _OPERATORS:
+                    to_visit.append(node)
+                    to_visit.append(None)
+                    # The operands are visited in order, the left one of a binary node being the second one.
+                    if data == "UNION" or data == "CONCAT":
+                        to_visit.append(node.left)
+                    to_visit.append(node.right)
+                    continue
+                if is_repetition(data):
+                    # Expanded and visited again: x{1} is x itself, which may be a repetition too.
+                    to_visit.append(repetition_tree(node))
+                    continue
+
+            # The final state of a fragment has no transition until the fragment is linked, and q is new: their
+            # transitions are set at once, without going through insert_graph.
+            if data == "CONCAT":
+                second_final = finals.pop()
+                finals[-1].eps = [starts.pop()]
+                finals[-1] = second_final
+                continue
+            q = NodeGraph(self.state_number, False, False)
+            f = NodeGraph(self.state_number + 1, False, False)
             self.state_number += 2
-            self._update_links(q, f, node_tree.right)
-            self._update_links(q, f, node_tree.left)
-            return q
-        elif node_tree.data == "STAR":
-            q = NodeGraph(self.state_number, True, False)
-            f = NodeGraph(self.state_number + 1, False, True)
+            states.add(q)
+            states.add(f)
+            if data == "UNION":
+                second_start = starts.pop()
+                first_start = starts.pop()
+                q.eps = [first_start, second_start]
+                finals.pop().eps = [f]
+                finals.pop().eps = [f]
+            elif data == "STAR" or data == "PLUS" or data == "MAYBE":
+                start = starts.pop()
+                q.eps = [start] if data == "PLUS" else [f, start]
+                finals.pop().eps = [f] if data == "MAYBE" else [f, start]
+            elif data == "eps":
+                q.eps = [f]
+            elif data != "void":
+                q.moves = {data: [f]}
+                self.add_char_in_alphabet(data)
+            starts.append(q)
+            finals.append(f)
+
+        start = starts.pop()
+        final = finals.pop()
+        start.is_start_state = True
+        start.start_state = start
+        start.final_state = final
+        final.is_final_state = True
+        final.final_state = final
+        return start
+
+
+# The nodes of a tree that have operands.
+_OPERATORS = ("UNION", "CONCAT", "STAR", "PLUS", "MAYBE")
+
+
+def is_repetition(token: str) -> bool:
+    """
+    @param token: A token of a prenex.
+    @return: True if the token is a counted repetition {m,n}, {m,} or {m}.
+    """
+    return isinstance(token, str) and len(token) > 1 and token[0] == "{"
 
-            self.states.add(q)
-            self.states.add(f)
 
-            self.state_number += 2
-            q.update_final_state(f)
-            q.insert_graph(f, "eps")
-
-            right_graph = self._update_links(q, f, node_tree.right)
-            right_graph.final_state.insert_graph(right_graph, "eps")
-            return q
-        elif node_tree.data == "PLUS":
-            return self.NFA_Graph(NodeTree("CONCAT", node_tree.right, NodeTree("STAR", node_tree.right, None)))
-        elif node_tree.data == "MAYBE":
-            return self.NFA_Graph(NodeTree("UNION", node_tree.right, NodeTree("eps", None, None)))
-        else:
-            self.state_number += 2
-            left_graph = NodeGraph(self.state_number - 2, True, False)
-            right_graph = NodeGraph(self.state_number - 1, False, True)
+def repetition_bounds(token: str) -> Tuple[int, Optional[int]]:
+    """
+    @param token: A counted repetition {m,n}, {m,} or {m}.
+    @return: The tuple (m, n), n being None if there is no upper bound. Raises ValueError if the bounds are not
+    numbers or if n < m.
+    """
+    bounds = token[1:-1].split(",")
+    if token[-1] != "}" or len(bounds) > 2 or not bounds[0].isdigit() or not (bounds[-1].isdigit() or bounds[-1] == ""):
+        raise ValueError("Invalid repetition " + token)
+    low = int(bounds[0])
+    high = low if len(bounds) == 1 else int(bounds[1]) if bounds[1] else None
+    if high is not None and high < low:
+        raise ValueError("Invalid repetition " + token + ", the upper bound is smaller than the lower one")
+    return low, high
 
-            self.states.add(left_graph)
-            self.states.add(right_graph)
 
-            left_graph.insert_graph(right_graph, node_tree.data)
-            left_graph.update_final_state(right_graph)
-            self.add_char_in_alphabet(node_tree.data)
-            return left_graph
+def repetition_tree(node: NodeTree) -> NodeTree:
+    """
+    @param node: A counted repetition x{m,n}, x being node.right.
+    @return: An equivalent tree made of CONCAT, MAYBE, STAR and eps nodes: m times x, then the n - m optional
+    occurrences nested as x(x(x)?)?, so that each optional x is only tried after the previous one. The operand is
+    not copied, all the occurrences share the node of x.
+    """
+    low, high = repetition_bounds(node.data)
+    operand = node.right
+    if high is None:
+        tail = NodeTree("STAR", operand, None)
+    elif high > low:
+        tail = NodeTree("MAYBE", operand, None)
+        for _ in range(high - low - 1):
+            tail = NodeTree("MAYBE", NodeTree("CONCAT", operand, tail), None)
+    else:
+        tail = None
+    if tail is None and low == 0:
+        return NodeTree("eps", None, None)
+    tree = tail if tail is not None else operand
+    for _ in range(low if tail is not None else low - 1):
+        tree = NodeTree("CONCAT", operand, tree)
+    return tree
 
 
 def create_tree(stack: list) -> NodeTree:
     """
-    @param stack: List of operators.
-    @return: Tree with all operators.
+    @param stack: List of operators, the prenex being read from the end of the list.
+    @return: Tree with all operators. The prenex is read backwards, so that every operator finds its operands already
+    built on a stack of trees: no recursion is needed, however deep the tree.
     """
-    aux = stack.pop()
-    if (aux == "UNION") or (aux == "CONCAT"):
-        node = NodeTree(aux, create_tree(stack), create_tree(stack))
-        return node
-    if aux == "STAR":
-        node = NodeTree(aux, create_tree(stack), None)
-        return node
-    if aux == "PLUS":
-        node_aux = create_tree(stack)
-        node = NodeTree("CONCAT",  node_aux, NodeTree("STAR", node_aux, None))
-        return node
-    if aux == "MAYBE":
-        node = NodeTree("UNION", NodeTree("eps", None, None), create_tree(stack))
-        return node
-    return NodeTree(aux, None, None)
+    trees = []
+    for aux in stack:
+        if (aux == "UNION") or (aux == "CONCAT"):
+            first = trees.pop()
+            trees.append(NodeTree(aux, first, trees.pop()))
+        elif aux in ("STAR", "PLUS", "MAYBE") or is_repetition(aux):
+            trees.append(NodeTree(aux, trees.pop(), None))
+        elif len(aux) > 1 and aux[0] == "[":
+            trees.append(NodeTree(CharSet.fromToken(aux).label(), None, None))
+        else:
+            trees.append(NodeTree(aux, None, None))
+    return trees.pop()
 
 
 def reverse_string(x):
@@ -1,278 +1,181 @@
 from __future__ import annotations
-import string
-from src.Regex import Character, Operator
+import re
+from typing import Tuple
+from src.CharSet import CharSet, DOT
+from src.NFA import NodeTree, is_repetition
+
+# A counted repetition {m,n}, {m,} or {m}. A brace that does not start one is an ordinary character.
+_REPETITION = re.compile(r"\{\d+(,\d*)?\}")
+# The tree node of each postfix operator.
+_POSTFIX = {"*": "STAR", "+": "PLUS", "?": "MAYBE"}
 
 class Parser:
     @staticmethod
-    def transform_syntactic_sugars(alphabet: list, character1, character2):
-        """
-        Transforms syntactic sugars in a regular expression.
-        @param alphabet: A list of characters to be transformed.
-        @param character1: The first character in the syntactic sugar pattern.
-        @param character2: The second character in the syntactic sugar pattern.
-        @return: A list of transformed characters in the regular expression. If character2 is not found in the alphabet,
-         returns None.
-        """
-        res = []
-        character1_found = False
-        for i in alphabet:
-            if i == character2:
-                if character1 == character2:
-                    res.append(Operator("("))
-                res.append(Character(i))
-                res.append(Operator(")"))
-                return res
-
-            if i == character1:
-                character1_found = True
-                res.append(Operator("("))
-            if character1_found:
-                res.append(Character(i))
-                res.append(Operator("|"))
-
-        return None
+    def character_class(regex: str, i: int) -> Tuple[CharSet | str, int]:
+        """
+        Reads a character class: [ then ^ if it is negated, then characters and ranges x-y, then ]. A character may be
+        quoted as 'x', a - before the ] is a character.
+        @param regex: The regex.
+        @param i: The position of the [.
+        @return: A tuple (label, end): the class, or its character if it has a single one, and the position after the
+        ]. Raises ValueError if the class is not terminated, has a range x-y with y < x or holds no character.
+        """
+        start = i
+        i += 1
+        negated = regex.startswith("^", i)
+        if negated:
+            i += 1
+        intervals = []
+        while i < len(regex) and regex[i] != "]":
+            low, i = _class_char(regex, i)
+            high = low
+            if i + 1 < len(regex) and regex[i] == "-" and regex[i + 1] != "]":
+                high, i = _class_char(regex, i + 1)
+                if high < low:
+                    raise ValueError("Invalid range " + low + "-" + high + " at " + str(start) + " in " + regex)
+            intervals.append((ord(low), ord(high)))
+        if i >= len(regex):
+            raise ValueError("Unterminated character class at " + str(start) + " in " + regex)
+        char_set = CharSet(intervals)
+        if negated:
+            char_set = char_set.negate()
+        if len(char_set.intervals) == 0:
+            raise ValueError("Empty character class at " + str(start) + " in " + regex)
+        return char_set.label(), i + 1
 
     @staticmethod
-    def syntactic_sugars(character1, character2):
+    def toTree(regex: str) -> NodeTree:
         """
-        Returns a list of transformed characters in the regular expression for a given syntactic sugar pattern.
-        @param character1: The first character in the syntactic sugar pattern.
-        @param character2: The second character in the syntactic sugar pattern.
-        @return: A list of transformed characters in the regular expression for the given syntactic sugar pattern.
+        Parses a regex in one pass, with a stack of operands (trees) and a stack of pending binary operators: a
+        postfix operator applies at once to the last operand, and a union first applies the pending concatenations,
+        which bind tighter. Both are right associative, abc is CONCAT a CONCAT b c. No recursion is needed, however
+        deep the parentheses.
+        @param regex: Regex, in the syntax of the lexer configurations.
+        @return: The tree of the regex, as built by create_tree from its prenex. Raises ValueError if the regex is
+        invalid.
         """
-        res = []
-        numbers = list(string.digits)
-        lower_letters = list(string.ascii_lowercase)
-        upper_letters = list(string.ascii_uppercase)
-        if character1 in numbers:
-            res.extend(Parser.transform_syntactic_sugars(numbers, character1, character2))
-        elif character1 in lower_letters:
-            res.extend(Parser.transform_syntactic_sugars(lower_letters, character1, character2))
-        elif character1 in upper_letters:
-            res.extend(Parser.transform_syntactic_sugars(upper_letters, character1, character2))
-
-        return res
-
-    @staticmethod
-    def preprocess(regex: str) -> list:
-        """
-        Preprocesses a regular expression string to add concatenation operators where necessary.
-        @param regex: The regular expression string to preprocess.
-        @return: A list of operators and characters with concatenation operators added where necessary.
-        """
-        operators = ["(", ")", "[", "]", "*", "+","?", "|"]
-        chars = ["+","*",")","?", "|"]
-        previous = None
-        res = []
-        str_len = len(regex)
+        operands = []
+        operators = []
+        # True when the last element read ends an operand, so that an operand or a "(" after it is concatenated.
+        after_operand = False
+        length = len(regex)
         i = 0
-        while i < str_len:
-            # Add concatenation operator if necessary
-            if previous is not None:
-                if previous != Operator("(") and previous != Operator("|"):
-                    if regex[i] not in chars:
-                        res.append(Operator("&"))
-            # Handle character classes
-            if regex[i] == "[":
-                res.extend(Parser.syntactic_sugars(regex[i + 1], regex[i + 3]))
-                i += 5
-                previous = Operator(")")
-                continue
-            # Handle eps character
-            elif regex[i] == "e" and ((i + 2) < str_len):
-                if regex[i + 1] == "p" and regex[i + 2] == "s":
-                    res.append(Character("eps"))
-                    i += 3
+        while i < length:
+            char = regex[i]
+            repetition = _REPETITION.match(regex, i) if char == "{" else None
+            if char in _POSTFIX or repetition is not None:
+                if not after_operand:
+                    raise ValueError("Operator " + char + " without an operand at " + str(i) + " in " + regex)
+                if repetition is not None:
+                    operands.append(NodeTree(repetition.group(), operands.pop(), None))
+                    i = repetition.end()
                 else:
-                    previous = Character(regex[i])
-                    res.append(Character(regex[i]))
+                    operands.append(NodeTree(_POSTFIX[char], operands.pop(), None))
                     i += 1
                 continue
-            # Handle escaped characters
-            elif regex[i] == "'":
-                aux = regex[i] + regex[i+1] + regex[i+2]
-                previous = aux
-                res.append(Character(aux))
-                i += 3
-            # Handle operators and regular characters
-            else:
-                if regex[i] in operators:
-                    previous = Operator(regex[i])
-                    res.append(Operator(regex[i]))
+            if char == "|" or char == ")":
+                if not after_operand:
+                    raise ValueError("Operator " + char + " without an operand at " + str(i) + " in " + regex)
+                while len(operators) != 0 and operators[-1] != "(" and (char == ")" or operators[-1] == "CONCAT"):
+                    _apply(operands, operators.pop())
+                if char == "|":
+                    operators.append("UNION")
+                    after_operand = False
+                elif len(operators) == 0:
+                    raise ValueError("Unbalanced ) at " + str(i) + " in " + regex)
                 else:
-                    previous = Character(regex[i])
-                    res.append(Character(regex[i]))
+                    operators.pop()
                 i += 1
-        return res
-
-
-    @staticmethod
-    def getPrioprity(operator):
-        """
-        Given an operator, returns its priority value according to the following rules:
-        - Parentheses have the lowest priority (0)
-        - The OR operator (|) has priority 1
-        - The concatenation operator (&) has priority 2
-        - High priority operators (+, *, ?) have priority 3
-        - Any other operator has priority 0
-        @param operator: the operator for which to determine priority.
-        @return: The priority value of the operator.
-        """
-        parentheses = [Operator("("), Operator(")")]
-        high_priority_operators = [Operator("+"), Operator("*"), Operator("?")]
-        if operator in parentheses:
-            return 0
-        if operator == Operator("|"):
-            return 1
-        if operator == Operator("&"):
-            return 2
-        if operator in high_priority_operators:
-            return 3
-        return 0
-
-
-
-    @staticmethod
-    def infixToPrefix(infix):
-        """
-        Convert the given infix expression to prefix notation.
-        @param infix: The list containing the infix expression.
-        @return: The list containing the prefix expression.
-        """
-        operators_with_2_operands = [Operator("|"), Operator("&"), Operator("("), Operator(")")]
-        operators_with_1_operand = [Operator("+"), Operator("*"), Operator("?")]
-
-        operators = []
-        characters = []
-
-        # Iterate through each element of the infix expression
-        for elem in infix:
-            if elem == Operator("("):
-                operators.append(elem)
-            elif elem == Operator(")"):
-                # If element is closing parenthesis, apply operators until matching opening parenthesis is found
-                while len(operators) != 0 and operators[-1] != Operator("("):
-                    Parser.applyOperator(characters, operators, operators_with_1_operand, operators_with_2_operands)
+                continue
 
-                operators.pop()
-            elif isinstance(elem,Character):
-                # If element is a character, push onto characters stack
-                characters.append(elem)
+            # An operand or a group, concatenated to the previous operand.
+            if after_operand:
+                operators.append("CONCAT")
+            if char == "(":
+                operators.append("(")
+                after_operand = False
+                i += 1
+                continue
+            if char == "[":
+                label, i = Parser.character_class(regex, i)
+                operands.append(NodeTree(label, None, None))
+            elif char == ".":
+                operands.append(NodeTree(DOT, None, None))
+                i += 1
+            elif char == "'":
+                if i + 2 >= length or regex[i + 2] != "'":
+                    raise ValueError("Unterminated quoted character at " + str(i) + " in " + regex)
+                operands.append(NodeTree(regex[i + 1], None, None))
+                i += 3
+            elif regex.startswith("eps", i):
+                operands.append(NodeTree("eps", None, None))
+                i += 3
+            elif char == "]":
+                raise ValueError("Unbalanced ] at " + str(i) + " in " + regex)
             else:
-                # If element is an operator, apply operators until top of stack has lower priority
-                while len(operators) != 0 and Parser.getPrioprity(elem) < Parser.getPrioprity(operators[-1]):
-                    Parser.applyOperator(characters, operators, operators_with_1_operand, operators_with_2_operands)
+                operands.append(NodeTree(char, None, None))
+                i += 1
+            after_operand = True
 
-                operators.append(elem)
-        # Apply remaining operators to characters stack
+        if not after_operand:
+            raise ValueError("Incomplete regex " + regex)
         while len(operators) != 0:
-            Parser.applyOperator(characters, operators, operators_with_1_operand, operators_with_2_operands)
-
-        return characters
+            operator = operators.pop()
+            if operator == "(":
+                raise ValueError("Unbalanced ( in " + regex)
+            _apply(operands, operator)
+        return operands.pop()
 
     @staticmethod
-    def applyOperator(characters, operators, operators_with_1_operand, operators_with_2_operands):
-        """
-        Apply the next operator on the top of the operators stack to the top 1 or 2 characters of the characters stack.
-        @param characters: A list of characters and previously applied operators.
-        @param operators: A list of operators in infix notation.
-        @param operators_with_1_operand: A list of operators that take only one operand.
-        @param operators_with_2_operands: A list of operators that take two operands.
-        """
-        operator = operators.pop()
-        if operator in operators_with_2_operands:
-            char1 = characters.pop()
-            char2 = characters.pop()
-            characters.append([operator, char2, char1])
-        elif operator in operators_with_1_operand:
-            char1 = characters.pop()
-            characters.append([operator, char1])
+    def treeToPrenex(tree: NodeTree) -> str:
+        """
+        @param tree: The tree of a regex.
+        @return: The prenex of the tree, which create_tree turns back into the same tree. The space and the quote are
+        quoted, as in 'x', and a class is written as str(CharSet) writes it.
+        """
+        tokens = []
+        to_visit = [tree]
+        while len(to_visit) > 0:
+            node = to_visit.pop()
+            data = node.data
+            if data == "UNION" or data == "CONCAT":
+                to_visit.append(node.left)
+                to_visit.append(node.right)
+            elif data in ("STAR", "PLUS", "MAYBE") or is_repetition(data):
+                to_visit.append(node.right)
+            elif isinstance(data, CharSet):
+                data = str(data)
+            elif data == " " or data == "'":
+                data = "'" + data + "'"
+            tokens.append(data)
+        return " ".join(tokens)
 
     @staticmethod
-    def list_to_char_list(prenex):
-        """
-        Convert the given prenex expression to a list of characters.
-        @param prenex: The prenex expression to convert.
-        @return: A list of characters.
-        """
-        if isinstance(prenex, Operator):
-            return prenex.op
-        if isinstance(prenex,Character):
-            if prenex == Character("eps"):
-                return "eps"
-            return prenex.chr
-        res = []
-        for elem in prenex:
-            if elem == Character("eps"):
-                res.append("eps")
-            else:
-                res.extend(Parser.list_to_string(elem))
-        return res
-
-    @staticmethod
-    def list_to_string(prenex):
+    def toPrenex(s: str) -> str:
         """
-        Convert the given list of characters or operators to a string.
-        @param prenex: The list containing characters and/or operators.
-        @return: A string representation of the input list.
+        The lexer builds its NFAs from the trees of toTree, the prenex is only a readable view of them.
+        @param s: Regex.
+        @return: The prenex of the regex, e.g. CONCAT a STAR b for ab*.
         """
-        vec = Parser.list_to_char_list(prenex)
-        res = ""
-        for i in vec:
-            res += i
-
-        return res
+        return Parser.treeToPrenex(Parser.toTree(s))
 
 
-    @staticmethod
-    def prenex_to_DFA_prenex(prenex):
-        """
-        Convert the given prenex expression to DFA prenex notation.
-        @param prenex: The list containing the prenex expression.
-        @return: The string containing the DFA prenex expression.
-        """
-        res = ""
-        i = 0
-        while i < len(prenex):
-            if prenex[i] == "|":
-                res += "UNION "
-                i += 1
-            elif prenex[i] == "&":
-                res += "CONCAT "
-                i += 1
-            elif prenex[i] == "*":
-                res += "STAR "
-                i += 1
-            elif prenex[i] == "+":
-                res += "PLUS "
-                i += 1
-            elif prenex[i] == "?":
-                res += "MAYBE "
-                i += 1
-            else:
-                if prenex[i] == "e" and (i + 2) < len(prenex):
-                    if prenex[i + 1] == 'p' and prenex[i + 2] == 's':
-                        res += "eps"
-                        i += 3
-                        continue
-                if prenex[i] == "'":
-                    res += prenex[i]
-                    i += 1
-                    while prenex[i] != "'":
-                        res += prenex[i]
-                        i += 1
-                    res += prenex[i]
-                    if i < len(prenex) - 1:
-                        res += " "
-                    i += 1
-                    continue
-                res += prenex[i]
-                if i != len(prenex) - 1:
-                    res += " "
-                i += 1
-        return res
+def _apply(operands: list, operator: str):
+    """
+    Replaces the last two operands by the node of a binary operator.
+    @param operands: The stack of operands.
+    @param operator: UNION or CONCAT.
+    """
+    second = operands.pop()
+    operands.append(NodeTree(operator, operands.pop(), second))
 
 
-    @staticmethod
-    def toPrenex(s: str) -> str:
-        return Parser.prenex_to_DFA_prenex(Parser.list_to_string(Parser.infixToPrefix(Parser.preprocess(s))))
\ No newline at end of file
+def _class_char(regex: str, i: int) -> Tuple[str, int]:
+    """
+    @return: The character of a class at position i, quoted or not, and the position after it.
+    """
+    if regex[i] == "'":
+        if i + 2 >= len(regex) or regex[i + 2] != "'":
+            raise ValueError("Unterminated quoted character at " + str(i) + " in " + regex)
+        return regex[i + 1], i + 3
+    return regex[i], i + 1
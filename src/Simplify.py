@@ -0,0 +1,234 @@
+from __future__ import annotations
+from typing import Dict, List, Optional
+
+from src.CharSet import CharSet, intervals
+from src.NFA import NodeTree, _OPERATORS, is_repetition, repetition_bounds
+
+# The loops that absorb each other: the loop of a loop is the first one if both are the same, a star otherwise.
+_LOOPS = ("STAR", "PLUS", "MAYBE")
+
+
+def _is_label(data) -> bool:
+    """
+    @param data: The data of a node of a tree.
+    @return: True if the node is a character or a class.
+    """
+    return isinstance(data, CharSet) or len(data) == 1
+
+
+def thompson_states(tree: NodeTree) -> int:
+    """
+    @param tree: The tree of a regex, as built by Parser.toTree.
+    @return: The number of states of the NFA that Thompson's construction builds from the tree (see NFA.NFA_Graph),
+    without building it: two states per node but the concatenations, the counted repetitions being expanded as
+    repetition_tree does.
+    """
+    sizes = []
+    to_visit = [(tree, False)]
+    while len(to_visit) > 0:
+        node, visited = to_visit.pop()
+        data = node.data
+        if not visited and (data in _OPERATORS or is_repetition(data)):
+            to_visit.append((node, True))
+            if data == "UNION" or data == "CONCAT":
+                to_visit.append((node.left, False))
+            to_visit.append((node.right, False))
+            continue
+        if data == "UNION" or data == "CONCAT":
+            size = sizes.pop() + sizes.pop() + (2 if data == "UNION" else 0)
+        elif data in _LOOPS:
+            size = sizes.pop() + 2
+        elif is_repetition(data):
+            operand = sizes.pop()
+            low, high = repetition_bounds(data)
+            if high is None:
+                size = (low + 1) * operand + 2
+            elif high > low or low > 0:
+                size = low * operand + (high - low) * (operand + 2)
+            else:
+                size = 2
+        else:
+            size = 2
+        sizes.append(size)
+    return sizes.pop()
+
+
+def simplify_tree(tree: NodeTree) -> NodeTree:
+    """
+    Rewrites a regex into a smaller one that matches the same words, in one pass over the tree, from the leaves up:
+    - eps is dropped from concatenations, void from unions, and a concatenation with void is void;
+    - a loop of a loop is a single loop, e.g. (x*)* and a?* are x* and a*, and {0,}, {1,}, {0,1} and {1} are
+    written as STAR, PLUS, MAYBE and the operand itself;
+    - the alternatives of a union are put in a trie of their concatenated parts: the same alternative is kept once,
+    the common prefixes are factored out, so that a list of keywords shares its first characters, and an empty
+    alternative makes the rest optional;
+    - the alternatives that are a character or a class followed by the same suffix are merged into one class, e.g.
+    a|b|c is [abc] and ax|bx is [ab]x.
+    The subtrees that are equal are numbered the same (hash consing), so comparing them takes O(1).
+    @param tree: The tree of a regex, as built by Parser.toTree. It is not changed.
+    @return: The simplified tree, its nodes are new.
+    """
+    return _Simplifier().simplify(tree)
+
+
+class _Simplifier:
+
+    def __init__(self):
+        # The number of each subtree, and the number of each (data, number of right, number of left) seen so far.
+        self.keys: Dict[NodeTree, int] = {}
+        self.numbers: Dict[tuple, int] = {}
+
+    def node(self, data, right: Optional[NodeTree] = None, left: Optional[NodeTree] = None) -> NodeTree:
+        """
+        @return: A new node, numbered after its data and its operands.
+        """
+        node = NodeTree(data, right, left)
+        key = (data, self.keys[right] if right is not None else -1, self.keys[left] if left is not None else -1)
+        self.keys[node] = self.numbers.setdefault(key, len(self.numbers))
+        return node
+
+    def simplify(self, tree: NodeTree) -> NodeTree:
+        results = []
+        # A chain of UNION (or CONCAT) nodes is a single node with all the operands of the chain.
+        to_visit = [(tree, None)]
+        while len(to_visit) > 0:
+            node, operands = to_visit.pop()
+            data = node.data
+            if operands is not None and (data == "UNION" or data == "CONCAT"):
+                done = results[len(results) - operands:]
+                del results[len(results) - operands:]
+                results.append(self.union(done) if data == "UNION" else self.concat(done))
+            elif operands is not None:
+                results.append(self.loop(data, results.pop()))
+            elif data == "UNION" or data == "CONCAT":
+                chain = _chain(node, data)
+                to_visit.append((node, len(chain)))
+                to_visit.extend((operand, None) for operand in reversed(chain))
+            elif data in _LOOPS or is_repetition(data):
+                to_visit.append((node, 1))
+                to_visit.append((node.right, None))
+            else:
+                results.append(self.node(data))
+        return results.pop()
+
+    def loop(self, data: str, operand: NodeTree) -> NodeTree:
+        """
+        @return: The simplified tree of the loop (STAR, PLUS, MAYBE or a counted repetition) of the operand.
+        """
+        if is_repetition(data):
+            low, high = repetition_bounds(data)
+            data = {(0, None): "STAR", (1, None): "PLUS", (0, 1): "MAYBE"}.get((low, high), data)
+            if high == 1 and low == 1:
+                return operand
+            if high == 0 or operand.data == "eps" or operand.data == "void":
+                return self.node("eps" if low == 0 or operand.data == "eps" else "void")
+            return self.node(data, operand) if is_repetition(data) else self.loop(data, operand)
+        if operand.data == "eps" or operand.data == "void":
+            return self.node("void" if data == "PLUS" and operand.data == "void" else "eps")
+        if operand.data in _LOOPS:
+            if operand.data == data:
+                return operand
+            return self.node("STAR", operand.right)
+        return self.node(data, operand)
+
+    def concat(self, operands: List[NodeTree]) -> NodeTree:
+        """
+        @param operands: The simplified operands, in order.
+        @return: The simplified concatenation of the operands.
+        """
+        parts = []
+        for operand in operands:
+            if operand.data == "void":
+                return operand
+            if operand.data == "CONCAT":
+                parts.extend(_chain(operand, "CONCAT"))
+            elif operand.data != "eps":
+                parts.append(operand)
+        return self.sequence(parts)
+
+    def sequence(self, parts: List[NodeTree]) -> NodeTree:
+        """
+        @return: The concatenation of the parts, nested to the right as the parser does, eps if there are none.
+        """
+        if len(parts) == 0:
+            return self.node("eps")
+        tree = parts[-1]
+        for part in reversed(parts[:-1]):
+            tree = self.node("CONCAT", part, tree)
+        return tree
+
+    def union(self, alternatives: List[NodeTree]) -> NodeTree:
+        """
+        @param alternatives: The simplified alternatives.
+        @return: The simplified union of the alternatives, built from the trie of their parts.
+        """
+        # A trie node is [children, empty]: its children by the number of their first part, each a pair (part,
+        # trie node), and whether an alternative ends at the node.
+        root = [{}, False]
+        alternatives = [alternative for alternative in alternatives if alternative.data != "void"]
+        if len(alternatives) == 0:
+            return self.node("void")
+        for alternative in alternatives:
+            trie = root
+            if alternative.data == "CONCAT":
+                parts = _chain(alternative, "CONCAT")
+            else:
+                parts = [alternative] if alternative.data != "eps" else []
+            for part in parts:
+                trie = trie[0].setdefault(self.keys[part], (part, [{}, False]))[1]
+            trie[1] = True
+
+        # The trees of the trie nodes, from the leaves up: None stands for eps.
+        trees: Dict[int, Optional[NodeTree]] = {}
+        to_visit = [(root, False)]
+        while len(to_visit) > 0:
+            trie, visited = to_visit.pop()
+            children, empty = trie
+            if not visited:
+                to_visit.append((trie, True))
+                to_visit.extend((child, False) for _, child in children.values())
+                continue
+            branches = []
+            # The classes that the branches with the same suffix are merged into, by the number of the suffix.
+            merged: Dict[int, List] = {}
+            for part, child in children.values():
+                suffix = trees.pop(id(child))
+                if _is_label(part.data):
+                    key = self.keys[suffix] if suffix is not None else -1
+                    if key in merged:
+                        merged[key][0].extend(intervals(part.data))
+                        continue
+                    merged[key] = [list(intervals(part.data)), suffix]
+                    branches.append(merged[key])
+                else:
+                    branches.append(self.sequence([part] + _chain(suffix, "CONCAT") if suffix is not None else [part]))
+            for i, branch in enumerate(branches):
+                if isinstance(branch, list):
+                    label = self.node(CharSet(branch[0]).label())
+                    branches[i] = self.sequence([label] + _chain(branch[1], "CONCAT") if branch[1] is not None else [label])
+            tree = None
+            if len(branches) > 0:
+                tree = branches[-1]
+                for branch in reversed(branches[:-1]):
+                    tree = self.node("UNION", branch, tree)
+                if empty:
+                    tree = self.loop("MAYBE", tree)
+            trees[id(trie)] = tree
+        tree = trees.pop(id(root))
+        return tree if tree is not None else self.node("eps")
+
+
+def _chain(node: NodeTree, data: str) -> List[NodeTree]:
+    """
+    @return: The operands of the chain of UNION or CONCAT nodes (data) whose top is node, in order.
+    """
+    operands = []
+    to_visit = [node]
+    while len(to_visit) > 0:
+        node = to_visit.pop()
+        if node.data == data:
+            to_visit.append(node.left)
+            to_visit.append(node.right)
+        else:
+            operands.append(node)
+    return operands
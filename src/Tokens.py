@@ -0,0 +1,134 @@
+from __future__ import annotations
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from itertools import compress
+from operator import itemgetter
+from typing import Dict, Iterator, List, Tuple
+
+
+class LineIndex:
+    """
+    Maps offsets in a text to (line, column) pairs, both counted from 0 as in the lexer error messages. The offsets of
+    the newlines are collected the first time they are needed, then every query is a binary search.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self._newlines = None
+
+    @property
+    def newlines(self) -> array:
+        """
+        @return: The sorted offsets of the newlines of the text.
+        """
+        if self._newlines is None:
+            newline = "\n" if isinstance(self.text, str) else b"\n"
+            newlines = array("q")
+            i = self.text.find(newline)
+            while i >= 0:
+                newlines.append(i)
+                i = self.text.find(newline, i + 1)
+            self._newlines = newlines
+        return self._newlines
+
+    def line(self, offset: int) -> int:
+        """
+        @param offset: An offset in the text.
+        @return: The number of newlines before offset.
+        """
+        return bisect_left(self.newlines, offset)
+
+    def position(self, offset: int) -> Tuple[int, int]:
+        """
+        @param offset: An offset in the text.
+        @return: The tuple (line, column) of the offset.
+        """
+        line = self.line(offset)
+        if line == 0:
+            return 0, offset
+        return line, offset - self.newlines[line - 1] - 1
+
+
+class TokenColumns:
+    """
+    Columnar token stream: the token ids, the start offsets and the end offsets are kept in three parallel arrays
+    instead of one tuple per token. The token ids index names, which is the order of the lexer configuration.
+    """
+
+    def __init__(self, names: List[str], text=None, kinds: array = None, starts: array = None, ends: array = None):
+        self.names = names
+        self.text = text
+        self.kinds = array("H") if kinds is None else kinds
+        self.starts = array("q") if starts is None else starts
+        self.ends = array("q") if ends is None else ends
+        self._lines = None
+
+    def extend(self, offsets: List[Tuple[int, int, int]]):
+        """
+        Appends tokens at the end of the stream.
+        @param offsets: List of tuples (TOKEN_ID, START, END).
+        """
+        self.kinds.extend(map(itemgetter(0), offsets))
+        self.starts.extend(map(itemgetter(1), offsets))
+        self.ends.extend(map(itemgetter(2), offsets))
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    def __iter__(self) -> Iterator[Tuple[str, int, int]]:
+        names = self.names
+        for kind, start, end in zip(self.kinds, self.starts, self.ends):
+            yield names[kind], start, end
+
+    def __getitem__(self, index):
+        """
+        @param index: An integer or a slice.
+        @return: The tuple (TOKEN, START, END) of a token, or a TokenColumns for a slice (the arrays are sliced, the
+        text is shared).
+        """
+        if isinstance(index, slice):
+            return TokenColumns(self.names, self.text, self.kinds[index], self.starts[index], self.ends[index])
+        return self.names[self.kinds[index]], self.starts[index], self.ends[index]
+
+    def lexeme(self, index: int):
+        """
+        @param index: The index of a token.
+        @return: The lexeme of the token, sliced from the text that was lexed.
+        """
+        return self.text[self.starts[index]:self.ends[index]]
+
+    def position(self, index: int) -> Tuple[int, int]:
+        """
+        @param index: The index of a token.
+        @return: The tuple (line, column) where the token starts in the text that was lexed.
+        """
+        if self._lines is None:
+            self._lines = LineIndex(self.text)
+        return self._lines.position(self.starts[index])
+
+    def histogram(self) -> Dict[str, int]:
+        """
+        @return: The number of tokens of each kind, in the order of the configuration. Kinds without tokens are left out.
+        """
+        counts = Counter(self.kinds)
+        return {name: counts[kind] for kind, name in enumerate(self.names) if kind in counts}
+
+    def select(self, *names: str) -> TokenColumns:
+        """
+        @param names: Token names.
+        @return: The tokens of the given kinds, in the same order.
+        """
+        wanted = {self.names.index(name) for name in names}
+        mask = [kind in wanted for kind in self.kinds]
+        return TokenColumns(self.names, self.text, array("H", compress(self.kinds, mask)),
+                            array("q", compress(self.starts, mask)), array("q", compress(self.ends, mask)))
+
+    def to_numpy(self):
+        """
+        Requires NumPy. The arrays share their memory with the columns, nothing is copied.
+        @return: The tuple (kinds, starts, ends) of NumPy arrays.
+        """
+        import numpy
+        return (numpy.frombuffer(self.kinds, dtype=numpy.uint16), numpy.frombuffer(self.starts, dtype=numpy.int64),
+                numpy.frombuffer(self.ends, dtype=numpy.int64))
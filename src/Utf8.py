@@ -0,0 +1,98 @@
+from __future__ import annotations
+from typing import List, Tuple
+
+from src.CharSet import CharSet, intervals
+from src.NFA import NodeTree, _OPERATORS, is_repetition
+
+# The largest code point encoded with 1, 2 and 3 bytes.
+_LENGTH_BOUNDS = (0x7F, 0x7FF, 0xFFFF)
+
+
+def utf8_ranges(low: int, high: int) -> List[Tuple[Tuple[int, int], ...]]:
+    """
+    Compiles a range of code points into ranges of UTF-8 byte sequences. The range is split until each part is
+    encoded with the same number of bytes and every byte but the ones of a common prefix spans a whole range of
+    continuation bytes: the encodings of the part are then the sequences whose i-th byte is between the i-th bytes
+    of the encodings of its ends. The surrogates, which UTF-8 cannot encode, are left out.
+    @param low: The first code point.
+    @param high: The last code point.
+    @return: The sequences, each a tuple of (first byte, last byte) ranges, in no particular order.
+    """
+    sequences = []
+    to_split = [(low, high)]
+    while len(to_split) > 0:
+        low, high = to_split.pop()
+        if low > high:
+            continue
+        if low <= 0xDFFF and high >= 0xD800:
+            to_split.append((low, 0xD7FF))
+            to_split.append((0xE000, high))
+            continue
+        bound = next((bound for bound in _LENGTH_BOUNDS if low <= bound < high), None)
+        if bound is not None:
+            to_split.append((low, bound))
+            to_split.append((bound + 1, high))
+            continue
+        if high <= 0x7F:
+            sequences.append(((low, high),))
+            continue
+        for i in range(1, len(chr(high).encode())):
+            # The code points that only differ by their last i continuation bytes.
+            mask = (1 << (6 * i)) - 1
+            if low & ~mask != high & ~mask:
+                if low & mask != 0:
+                    to_split.append((low, low | mask))
+                    to_split.append(((low | mask) + 1, high))
+                    break
+                if high & mask != mask:
+                    to_split.append((low, (high & ~mask) - 1))
+                    to_split.append((high & ~mask, high))
+                    break
+        else:
+            sequences.append(tuple(zip(chr(low).encode(), chr(high).encode())))
+    return sequences
+
+
+def utf8_label_tree(label: CharSet | str) -> NodeTree:
+    """
+    @param label: A character or a class.
+    @return: The tree of the UTF-8 encodings of the characters of the label, over bytes read as Latin-1 characters:
+    a union of concatenations of byte ranges, void if the label only holds surrogates.
+    """
+    sequences = [sequence for low, high in intervals(label) for sequence in utf8_ranges(low, high)]
+    tree = None
+    for sequence in reversed(sequences):
+        branch = None
+        for low, high in reversed(sequence):
+            byte = NodeTree(CharSet([(low, high)]).label(), None, None)
+            branch = byte if branch is None else NodeTree("CONCAT", byte, branch)
+        tree = branch if tree is None else NodeTree("UNION", branch, tree)
+    return tree if tree is not None else NodeTree("void", None, None)
+
+
+def utf8_tree(tree: NodeTree) -> NodeTree:
+    """
+    @param tree: The tree of a regex, as built by Parser.toTree.
+    @return: The tree of the same regex over the UTF-8 encoding of the words: each character and class is replaced
+    by the tree of its encodings (see utf8_label_tree), the operators are kept. The ASCII characters are left as they
+    are. The tree is changed in place.
+    """
+    def convert(node: NodeTree) -> NodeTree:
+        data = node.data
+        if data in _OPERATORS or is_repetition(data):
+            # Only the operators are visited, the trees of the encodings are not converted again.
+            to_visit.append(node)
+            return node
+        if data == "eps" or data == "void" or isinstance(data, str) and data < "\x80":
+            return node
+        return utf8_label_tree(data)
+
+    to_visit = []
+    tree = convert(tree)
+    while len(to_visit) > 0:
+        node = to_visit.pop()
+        if node.right is not None:
+            node.right = convert(node.right)
+        if node.left is not None:
+            node.left = convert(node.left)
+    return tree
@@ -1,7 +1,9 @@
 import unittest
-import json, os
+import io, json, os, pickle, tempfile
+from concurrent.futures import ThreadPoolExecutor
 from src.DFA import DFA
-from src.Lex import Lexer
+from src.Lex import Lexer, LexerError
+from src.Tokens import LineIndex
 
 class RegexParseTests(unittest.TestCase):
     def test_simple_lexer_concat(self):
@@ -165,6 +167,266 @@ class RegexParseTests(unittest.TestCase):
 
         print("lexer split, complex paring error (10p)")
 
+    def test_lexer_linear_mode(self):
+        s = {"SPACE": "' '", "ABC": "a(b+)c", "AS": "(a)+", "BCS": "(bc)+", "DORC": "(d|c)+"}
+
+        lexer = Lexer(s)
+        linear_lexer = Lexer(s, linear=True)
+
+        for word in ["abcbcbcaabaad dccbca", "d abdbc ccddabbbc", "abbcaaabc dcccabcb", "abbbbbbbbbbbbbbbbc abbbbb", "aabbcbcdd"]:
+            self.assertEqual(linear_lexer.lex(word), lexer.lex(word))
+
+        lexer = Lexer({"A": "a", "AB": "a+b"}, linear=True)
+
+        self.assertEqual(lexer.lex("a" * 5000), [("A", "a")] * 5000)
+        self.assertEqual(lexer.lex("a" * 5000 + "b"), [("AB", "a" * 5000 + "b")])
+        self.assertEqual(lexer.lex("a" * 5000 + "c"), "No viable alternative at character 5000, line 0")
+
+    def test_lexer_iter(self):
+        s = {"SPACE": "' '", "NEWLINE": "'\n'", "ABC": "a(b+)c", "AS": "(a)+", "BCS": "(bc)+", "DORC": "(d|c)+"}
+
+        lexer = Lexer(s)
+        word = "abbbbbbc aaaa\nbcbcbc dcdc\nabc"
+
+        self.assertEqual(list(lexer.lex_iter(word)), lexer.lex(word))
+        self.assertEqual(list(lexer.lex_iter(io.StringIO(word), chunk_size=2)), lexer.lex(word))
+        self.assertEqual(list(lexer.lex_iter(["ab", "bb", "", "bbbc a", "aaa\nbcbcbc dcdc\n", "a", "bc"])), lexer.lex(word))
+
+        for word in ["abbcaaabc\ndcccabcb", "abc\nbcbcaabaad dccbca", "aaa\n\nbbb"]:
+            with self.assertRaises(LexerError) as error:
+                list(lexer.lex_iter(io.StringIO(word), chunk_size=3))
+            self.assertEqual(str(error.exception), lexer.lex(word))
+
+    def test_lexer_bytes(self):
+        s = {"SPACE": "' '", "NEWLINE": "'\n'", "ABC": "a(b+)c", "AS": "(a)+", "BCS": "(bc)+", "DORC": "(d|c)+"}
+
+        lexer = Lexer(s)
+        word = b"abbbc aa\nbcbc dc"
+        tokens = [("ABC", 0, 5), ("SPACE", 5, 6), ("AS", 6, 8), ("NEWLINE", 8, 9), ("BCS", 9, 13), ("SPACE", 13, 14), ("DORC", 14, 16)]
+
+        self.assertEqual(lexer.lex_bytes(word), tokens)
+        self.assertEqual(lexer.lex_bytes(bytearray(word)), tokens)
+        self.assertEqual(lexer.lex_bytes(memoryview(word)), tokens)
+        self.assertEqual([(token, word[start:end].decode()) for token, start, end in tokens], lexer.lex(word.decode()))
+        self.assertEqual(lexer.lex_bytes(b"abc\nabcb\nx"), "No viable alternative at character 8, line 1")
+        self.assertEqual(lexer.lex_bytes(b"abc\nabcb\nbc\nab"), lexer.lex("abc\nabcb\nbc\nab"))
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "input.txt")
+            with open(path, "wb") as f:
+                f.write(word)
+            self.assertEqual(lexer.lex_file(path), tokens)
+            open(path, "wb").close()
+            self.assertEqual(lexer.lex_file(path), [])
+
+    def test_lexer_offsets(self):
+        s = {"SPACE": "' '", "ZEROS": "0+"}
+
+        lexer = Lexer(s)
+        word = "0" * 100000 + " 00"
+
+        self.assertEqual(lexer.lex_offsets(word), [(1, 0, 100000), (0, 100000, 100001), (1, 100001, 100003)])
+        self.assertEqual(lexer.lex(word), [("ZEROS", "0" * 100000), ("SPACE", " "), ("ZEROS", "00")])
+        self.assertEqual(lexer.lex_offsets("00 1"), "No viable alternative at character 3, line 0")
+
+    def test_lexer_columns(self):
+        s = {"SPACE": "' '", "ZEROS": "0+", "ONES": "1+"}
+
+        lexer = Lexer(s)
+        word = "0 00 111 0 1 " * 100
+        columns = lexer.lex_columns(word, block=7)
+
+        self.assertEqual(len(columns), 1000)
+        self.assertEqual([(token, word[start:end]) for token, start, end in columns], lexer.lex(word))
+        self.assertEqual(columns[2], ("ZEROS", 2, 4))
+        self.assertEqual(columns.lexeme(4), "111")
+        self.assertEqual(list(columns[1:3]), [("SPACE", 1, 2), ("ZEROS", 2, 4)])
+        self.assertEqual(columns.histogram(), {"SPACE": 500, "ZEROS": 300, "ONES": 200})
+        self.assertEqual(columns[:5].histogram(), {"SPACE": 2, "ZEROS": 2, "ONES": 1})
+        self.assertEqual(list(columns.select("ONES"))[:2], [("ONES", 5, 8), ("ONES", 11, 12)])
+        self.assertEqual(lexer.lex_columns("00 12"), "No viable alternative at character 4, line 0")
+
+    def test_lexer_positions(self):
+        s = {"SPACE": "' '", "NEWLINE": "'\n'", "ABC": "a(b+)c", "TEXT": "'\n'(d|'\n')*d"}
+
+        lexer = Lexer(s)
+        word = "abc abbc\n\nabc\nd\ndd abc"
+
+        self.assertEqual(lexer.lex_positions(word), [("ABC", "abc", 0, 0), ("SPACE", " ", 0, 3), ("ABC", "abbc", 0, 4), ("NEWLINE", "\n", 0, 8), ("NEWLINE", "\n", 1, 0), ("ABC", "abc", 2, 0), ("TEXT", "\nd\ndd", 2, 3), ("SPACE", " ", 4, 2), ("ABC", "abc", 4, 3)])
+        self.assertEqual(lexer.lex_positions("abc\n\nab"), lexer.lex("abc\n\nab"))
+
+        index = LineIndex(word)
+        for i, (token, lexeme, line, column) in enumerate(lexer.lex_positions(word)):
+            start = lexer.lex_offsets(word)[i][1]
+            self.assertEqual(index.position(start), (line, column))
+            self.assertEqual(lexer.lex_columns(word).position(i), (line, column))
+        self.assertEqual(index.line(len(word)), 4)
+        self.assertEqual(LineIndex("").position(0), (0, 0))
+
+    def test_lexer_parallel(self):
+        s = {"SPACE": "' '", "NEWLINE": "'\n'", "PATTERN1": "1' '0", "PATTERN2": "(10)+", "PATTERN3": "' '001' '", "PATTERN4": "(101' ')+", "PATTERN5": "1*01"}
+
+        lexer = Lexer(s)
+        word = "1010\n1 01111101\n 1010 101 101    001 " * 20
+
+        self.assertEqual(lexer.lex_parallel(word, workers=2, chunks=13), lexer.lex(word))
+        self.assertEqual(lexer.lex_parallel(word + "101 1", workers=2, chunks=7), lexer.lex(word + "101 1"))
+        self.assertEqual(lexer.lex_parallel(word + "2" + word, workers=2, chunks=9), "No viable alternative at character 740, line 40")
+
+        # The text is written with 2 and 4 bytes per character, for a compiled and a lazy DFA.
+        s = {"WORD": "[a-zé]+", "GREEK": "[α-ω]+", "SPACE": "' '", "OTHER": "[😀-😎]"}
+        for text in ("été αβγ x " * 50, "été 😀 αβγ 😎😀 " * 50):
+            for lexer in (Lexer(s), Lexer(s, lazy=True, max_states=4)):
+                self.assertEqual(lexer.lex_parallel(text, workers=2, chunks=11), lexer.lex(text))
+                self.assertEqual(lexer.lex_parallel(text + "!" + text, workers=2, chunks=11), lexer.lex(text + "!" + text))
+
+    def test_lexer_many(self):
+        s = {"NEWLINE": "'\n'", "ABC": "a(b+)c"}
+
+        lexer = Lexer(s)
+        words = ["abc\nabbc", "a zzzz", "", "abbbc\nabc\n\n\nabbbbbc\nabbbbb"] * 50
+        expected = [lexer.lex(word) for word in words]
+
+        self.assertEqual(lexer.lex_many(words, "process", workers=2, batch_size=7), expected)
+        self.assertEqual(lexer.lex_many(iter(words), "thread", workers=2), expected)
+        with ThreadPoolExecutor(2) as executor:
+            self.assertEqual(lexer.lex_many(words, executor, batch_size=3), expected)
+
+    def test_lexer_cache(self):
+        s = {"SPACE": "' '", "ABC": "a(b+)c", "AS": "(a)+", "BCS": "(bc)+", "DORC": "(d|c)+"}
+        word = "abcbcbcaabaad dccbc"
+
+        with tempfile.TemporaryDirectory() as directory:
+            lexer = Lexer(s, cache_dir=directory)
+            [path] = [os.path.join(directory, name) for name in os.listdir(directory)]
+            self.assertEqual(lexer.dfa.path, path)
+
+            cached = Lexer(s, cache_dir=directory)
+            self.assertEqual(cached.lex(word), Lexer(s).lex(word))
+            self.assertEqual(pickle.loads(pickle.dumps(cached)).lex(word), cached.lex(word))
+            self.assertEqual(len(Lexer({"A": "a"}, cache_dir=directory).lex("aa")), 2)
+            self.assertEqual(len(os.listdir(directory)), 2)
+
+            with open(path, "r+b") as f:
+                f.write(b"garbage")
+            self.assertEqual(Lexer(s, cache_dir=directory).lex(word), cached.lex(word))
+
+            # A cache that cannot be written is not an error, the DFA is used from memory.
+            uncached = Lexer(s, cache_dir=path)
+            self.assertIsNone(uncached.dfa.path)
+            self.assertEqual(uncached.lex(word), cached.lex(word))
+
+        # The threads that compile the same configuration at once each write their own temporary file.
+        with tempfile.TemporaryDirectory() as directory:
+            with ThreadPoolExecutor(8) as pool:
+                lexers = list(pool.map(lambda _: Lexer(s, cache_dir=directory), range(8)))
+            self.assertTrue(all(lexer.lex(word) == cached.lex(word) for lexer in lexers))
+            self.assertEqual(len(os.listdir(directory)), 1)
+
+        self.assertEqual(pickle.loads(pickle.dumps(Lexer(s))).lex(word), cached.lex(word))
+
+    def test_lexer_minimize(self):
+        s = {"SPACE": "' '", "ABC": "a(b+)c", "AS": "(a)+", "BCS": "(bc)+", "DORC": "(d|c)+", "AORB": "(a|b)(a|b)"}
+        lexer = Lexer(s)
+        minimized = Lexer(s, minimize=True)
+        self.assertLess(minimized.stats["states"], minimized.stats["subset_states"])
+        self.assertEqual(minimized.stats["subset_states"], lexer.stats["states"])
+        self.assertEqual(minimized.dfa.minimize().n_states, minimized.dfa.n_states)
+
+        for word in ["abcbcbcaabaad dccbc", "ab ba bb abbbc", "abbbbd", "bcbcb", "", "aaa x"]:
+            self.assertEqual(minimized.lex(word), lexer.lex(word))
+        linear = Lexer(s, linear=True, minimize=True)
+        self.assertEqual(linear.lex("abbbbd abbbbbb"), lexer.lex("abbbbd abbbbbb"))
+
+    def test_lexer_lazy(self):
+        s = {"SPACE": "' '", "NEWLINE": "'\n'", "ABC": "a(b+)c", "AS": "(a)+", "BCS": "(bc)+", "DORC": "(d|c)+"}
+        words = ["abcbcbcaabaad dccbc", "abbbbd abbbbbb", "abc\nabbc\n\nabbbc", "aaa x", "", "abcbcbca"]
+        lexer = Lexer(s)
+        lazy = Lexer(s, lazy=True)
+        self.assertEqual(lazy.dfa.n_states, 2)
+        for word in words:
+            self.assertEqual(lazy.lex(word), lexer.lex(word))
+            self.assertEqual(lazy.lex_bytes(word.encode()), lexer.lex_bytes(word.encode()))
+        self.assertLessEqual(lazy.dfa.n_states, lexer.dfa.n_states)
+
+        # Two states are kept at most: they are evicted and built again all the time.
+        small = Lexer(s, linear=True, lazy=True, max_states=2)
+        for word in words:
+            self.assertEqual(small.lex(word), lexer.lex(word))
+            self.assertEqual(small.lex_positions(word), lexer.lex_positions(word))
+        self.assertEqual(small.dfa.n_states, 3)
+        self.assertGreater(small.dfa.evictions, 0)
+        self.assertEqual(pickle.loads(pickle.dumps(small)).lex(words[0]), lexer.lex(words[0]))
+        self.assertEqual(lazy.lex_many(words, "process", workers=2, batch_size=2), lexer.lex_many(words, "thread"))
+        # The threads share the cache of small, whose states are evicted all the time.
+        self.assertEqual(small.lex_many(words * 200, "thread", workers=8, batch_size=2), lexer.lex_many(words * 200, "thread"))
+
+        with self.assertRaises(ValueError):
+            Lexer(s, lazy=True, minimize=True)
+        with self.assertRaises(ValueError):
+            Lexer(s, lazy=True, max_states=1)
+
+        # The transitions are cached by class: a state holds a few of them, whatever the characters of the input.
+        wide = Lexer({"ANY": "[^ ]+", "S": "' '"}, lazy=True, max_states=2)
+        word = "".join(chr(code) for code in range(0x4e00, 0x4e00 + 5000))
+        self.assertEqual(wide.lex(word), [("ANY", word)])
+        self.assertTrue(all(len(state.next) <= wide.dfa.classes.n_classes for state in wide.dfa.cache.values()))
+
+    def test_lexer_state_budget(self):
+        s = {"SPACE": "' '", "WORD": "(a|b)*a(a|b)(a|b)(a|b)(a|b)(a|b)(a|b)", "BS": "b+"}
+        words = ["abbbbbb bbb aabbbbbabab", "babababa b", "aab", "bbbbbbbbbbb ab"]
+        lexer = Lexer(s)
+        self.assertEqual(lexer.stats["engine"], "dfa")
+        self.assertEqual(Lexer(s, state_budget=lexer.stats["states"]).stats["engine"], "dfa")
+
+        nfa = Lexer(s, state_budget=20)
+        self.assertEqual(nfa.stats["engine"], "nfa")
+        for word in words:
+            self.assertEqual(nfa.lex(word), lexer.lex(word))
+            self.assertEqual(nfa.lex_bytes(word.encode()), lexer.lex_bytes(word.encode()))
+        linear = Lexer(s, linear=True, state_budget=20)
+        self.assertEqual(linear.lex(words[0] * 3), lexer.lex(words[0] * 3))
+        self.assertEqual(pickle.loads(pickle.dumps(nfa)).lex(words[1]), lexer.lex(words[1]))
+        with tempfile.TemporaryDirectory() as directory:
+            self.assertEqual(Lexer(s, cache_dir=directory, state_budget=20).lex(words[2]), lexer.lex(words[2]))
+            self.assertEqual(os.listdir(directory), [])
+
+    def test_lexer_character_classes(self):
+        s = {"IF": "if", "ID": "[a-zA-Z_][a-zA-Z0-9_]*", "STR": "'\"'[^\"\n]*'\"'", "COMMENT": "#.*",
+             "SPACE": "[ \n]+"}
+        word = 'if iffy _x9 "é, \U0001f600" # ç"\nx'
+        expected = [("IF", "if"), ("SPACE", " "), ("ID", "iffy"), ("SPACE", " "), ("ID", "_x9"), ("SPACE", " "),
+                    ("STR", '"é, \U0001f600"'), ("SPACE", " "), ("COMMENT", '# ç"'), ("SPACE", "\n"), ("ID", "x")]
+        lexer = Lexer(s)
+        self.assertEqual(lexer.lex(word), expected)
+        self.assertEqual(lexer.lex('"a\nb"'), "No viable alternative at character 2, line 0")
+        self.assertLess(lexer.stats["states"], 20)
+        self.assertEqual(Lexer({"DIGITS": "(0|1|2|3)+", "IF": "if|if"}).stats["simplified"], {"DIGITS": (16, 4), "IF": (10, 4)})
+        self.assertEqual(Lexer(s, lazy=True).lex(word), expected)
+        self.assertEqual(Lexer(s, minimize=True, state_budget=5).lex(word), expected)
+        self.assertEqual(lexer.lex_bytes(b'"\xe9\xff" x'), [("STR", 0, 4), ("SPACE", 4, 5), ("ID", 5, 6)])
+        with tempfile.TemporaryDirectory() as directory:
+            Lexer(s, cache_dir=directory)
+            self.assertEqual(Lexer(s, cache_dir=directory).lex(word), expected)
+
+    def test_lexer_utf8(self):
+        s = {"WORD": "[a-zß-ÿα-ω]+", "CJK": "[一-鿿]+", "EMOJI": "[😀-🙏]", "SPACE": "' '", "OTHER": "[^ ]"}
+        word = "straße λόγος 词法 😀€ x"
+        lexer = Lexer(s)
+        utf8 = Lexer(s, utf8=True)
+        self.assertLessEqual(utf8.dfa.n_classes, 256)
+        self.assertEqual(utf8.lex(word), lexer.lex(word))
+        self.assertEqual(utf8.lex_positions(word), lexer.lex_positions(word))
+        data = word.encode()
+        self.assertEqual([data[start:end].decode() for _, start, end in utf8.lex_bytes(data)],
+                         [lexeme for _, lexeme in lexer.lex(word)])
+        self.assertEqual(utf8.lex("ab 词\n"), lexer.lex("ab 词\n"))
+        self.assertEqual(Lexer({"A": "a", "E": "é"}, utf8=True).lex("aéaè"), "No viable alternative at character 3, line 0")
+        self.assertEqual(Lexer(s, utf8=True, lazy=True).lex_bytes(data), utf8.lex_bytes(data))
+        self.assertEqual(Lexer(s, utf8=True, minimize=True).lex_bytes(data), utf8.lex_bytes(data))
+        with self.assertRaises(ValueError):
+            utf8.lex_parallel(word)
+
     # def test_program(self):
     #     with open("src/configuration.json") as f:
     #         s = json.load(f)
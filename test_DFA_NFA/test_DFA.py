@@ -113,4 +113,49 @@ class DFATests(unittest.TestCase):
 		self.assertTrue(DFA.fromPrenex(s).accepts("ba"))
 		self.assertFalse(DFA.fromPrenex(s).accepts("a"))
 		self.assertFalse(DFA.fromPrenex(s).accepts("b"))
-		print("complex 7 (10p)")
\ No newline at end of file
+		print("complex 7 (10p)")
+
+	def test_compiled_dfa(self):
+		expr = "CONCAT UNION b STAR a STAR c"
+		dfa = DFA.fromPrenex(expr)
+		compiled = dfa.compile()
+		for word in ["", "a", "b", "aaaaaaaaaccccc", "bccccccccc", "bbbbccccccccc", "ca", "d"]:
+			self.assertEqual(compiled.accepts(word), dfa.accepts(word))
+		self.assertEqual(compiled.match("aacb", 0), (0, 3, 3))
+		self.assertEqual(compiled.match("d", 0), (-1, 0, 0))
+
+	def test_dfa_states_are_not_duplicated(self):
+		dfa = DFA.fromPrenex("CONCAT STAR UNION a b CONCAT a CONCAT UNION a b UNION a b")
+		subsets = [frozenset(state.states) for state in self.states(dfa)]
+		self.assertEqual(len(subsets), len(set(subsets)))
+		self.assertTrue(dfa.accepts("bbabb"))
+		self.assertFalse(dfa.accepts("bbbab"))
+
+	def test_dfa_long_epsilon_chain(self):
+		dfa = DFA.fromPrenex("CONCAT MAYBE a " * 449 + "MAYBE a")
+		self.assertTrue(dfa.accepts(""))
+		self.assertTrue(dfa.accepts("a" * 450))
+		self.assertFalse(dfa.accepts("a" * 451))
+
+	def test_dfa_equivalence_classes(self):
+		# The letters of [c-z] but x and y are never told apart, a and b are until the DFA is minimized.
+		dfa = DFA.fromPrenex("UNION CONCAT UNION a UNION b [c-z] x CONCAT y STAR [c-z]")
+		compiled = dfa.compile()
+		self.assertEqual(compiled.n_classes, 6)
+		self.assertEqual(compiled.classes["d"], compiled.classes["w"])
+		self.assertEqual(compiled.classes["A"], 0)
+		minimized = compiled.minimize()
+		self.assertEqual(minimized.n_classes, 5)
+		self.assertEqual(minimized.classes["a"], minimized.classes["b"])
+		self.assertNotEqual(minimized.classes["a"], minimized.classes["w"])
+		for word in ["ax", "bx", "wx", "y", "ycdz", "yx", "xx", "", "a"]:
+			self.assertEqual(minimized.accepts(word), dfa.accepts(word))
+
+	@staticmethod
+	def states(dfa):
+		states = [dfa.graph]
+		for state in states:
+			for transition in state.adj:
+				if transition.node not in states and transition.node is not dfa.sink:
+					states.append(transition.node)
+		return states
@@ -0,0 +1,48 @@
+import unittest
+from src.DFA import DFA
+from src.Glushkov import Glushkov
+
+
+class GlushkovTests(unittest.TestCase):
+	def test_glushkov_from_eps_and_void(self):
+		self.assertTrue(Glushkov.fromPrenex("eps").accepts(""))
+		self.assertFalse(Glushkov.fromPrenex("eps").accepts("a"))
+		self.assertFalse(Glushkov.fromPrenex("void").accepts(""))
+
+
+	def test_glushkov_from_char(self):
+		self.assertTrue(Glushkov.fromPrenex("a").accepts("a"))
+		self.assertFalse(Glushkov.fromPrenex("a").accepts("b"))
+		self.assertTrue(Glushkov.fromPrenex("' '").accepts(" "))
+
+
+	def test_glushkov_same_as_dfa(self):
+		expressions = ["CONCAT UNION b STAR a STAR c", "STAR CONCAT a b", "CONCAT a STAR a", "PLUS UNION a CONCAT b c",
+			"CONCAT MAYBE a PLUS b", "STAR STAR UNION a eps", "CONCAT PLUS CONCAT a MAYBE b c"]
+		words = ["", "a", "b", "c", "ab", "abab", "aaa", "bccccc", "aaaaccc", "abc", "bcbca", "aabc", "abbbc", "bbb"]
+		for expr in expressions:
+			glushkov = Glushkov.fromPrenex(expr)
+			dfa = DFA.fromPrenex(expr)
+			for word in words:
+				self.assertEqual(glushkov.accepts(word), dfa.accepts(word), expr + " on " + repr(word))
+
+
+	def test_glushkov_from_regex(self):
+		glushkov = Glushkov.fromRegex("[a-z]([a-z]|[0-9])*")
+		# A class is a single position, however many characters it holds.
+		self.assertEqual(glushkov.n_positions, 3)
+		# Bit 0 and the 3 positions: a single table of 16 entries.
+		self.assertEqual([len(table) for table in glushkov.tables], [16])
+		self.assertTrue(glushkov.accepts("abc123"))
+		self.assertFalse(glushkov.accepts("1abc"))
+		self.assertFalse(glushkov.accepts("abc 123"))
+		glushkov = Glushkov.fromRegex("'\"'[^\"]*'\"'")
+		self.assertTrue(glushkov.accepts('"a\u00e9 \U0001f600"'))
+		self.assertFalse(glushkov.accepts('"a"b"'))
+		glushkov = Glushkov.fromRegex("(a{1,2}){1}b")
+		self.assertEqual([word for word in ["b", "ab", "aab", "aaab"] if glushkov.accepts(word)], ["ab", "aab"])
+
+
+	def test_glushkov_too_many_positions(self):
+		with self.assertRaises(ValueError):
+			Glushkov.fromPrenex("CONCAT a " * Glushkov.MAX_POSITIONS + "a")
@@ -76,4 +76,69 @@ class NFATests(unittest.TestCase):
 	def test_nfa_from_complex_expression7(self):
 		expr = "CONCAT a STAR a"
 		self.assertTrue(NFA.fromPrenex(expr).accepts("aaa"))
-		self.assertFalse(NFA.fromPrenex(expr).accepts(""))
\ No newline at end of file
+		self.assertFalse(NFA.fromPrenex(expr).accepts(""))
+
+	def test_nfa_move_tables(self):
+		nfa = NFA.fromPrenex("UNION a CONCAT b c")
+		states = [nfa.graph]
+		for state in states:
+			moves = {letter: [] for letter in state.moves}
+			for transition in state.adj:
+				if transition.node not in states:
+					states.append(transition.node)
+				if transition.transition == "eps":
+					self.assertIn(transition.node, state.eps)
+				else:
+					moves[transition.transition].append(transition.node)
+			self.assertEqual(moves, state.moves)
+			self.assertEqual(len(state.eps) + sum(map(len, moves.values())), len(state.adj))
+		self.assertEqual(sorted(letter for state in states for letter in state.moves), ["a", "b", "c"])
+
+
+	def test_nfa_class_is_one_edge(self):
+		nfa = NFA.fromPrenex("STAR [0-9a-z]")
+		self.assertEqual(nfa.state_number, 4)
+		self.assertEqual(len(nfa.alphabet), 1)
+		self.assertTrue(nfa.accepts("0az9"))
+		self.assertFalse(nfa.accepts("0aZ9"))
+
+
+	def test_nfa_long_input(self):
+		expr = "CONCAT STAR a b"
+		self.assertTrue(NFA.fromPrenex(expr).accepts("a" * 50000 + "b"))
+		self.assertFalse(NFA.fromPrenex(expr).accepts("a" * 50000))
+
+
+	def test_nfa_nested_star_with_eps(self):
+		expr = "CONCAT STAR STAR UNION a eps b"
+		nfa = NFA.fromPrenex(expr)
+		self.assertTrue(nfa.accepts("b"))
+		self.assertTrue(nfa.accepts("aaaaaaaaaaaaaaaaaaaaaaaaab"))
+		self.assertFalse(nfa.accepts("aaaaaaaaaaaaaaaaaaaaaaaaaa"))
+		self.assertFalse(nfa.accepts("aaaaaaaaaaaaaaaaaaaaaaaaaba"))
+
+
+	def test_nfa_deep_expression(self):
+		nfa = NFA.fromPrenex("CONCAT a " * 20000 + "b")
+		self.assertTrue(nfa.accepts("a" * 20000 + "b"))
+		self.assertFalse(nfa.accepts("a" * 19999 + "b"))
+		self.assertEqual(len(nfa.getStates()), 40002)
+
+
+	def test_nfa_large_union(self):
+		words = ["w" + str(i) for i in range(10000)]
+		expr = "UNION " * (len(words) - 1) + " ".join("CONCAT " * (len(word) - 1) + " ".join(word) for word in words)
+		nfa = NFA.fromPrenex(expr)
+		self.assertTrue(nfa.graph.is_start_state)
+		self.assertTrue(nfa.graph.final_state.is_final_state)
+		self.assertEqual(sum(state.is_final_state for state in nfa.getStates()), 1)
+		self.assertTrue(nfa.accepts("w9999"))
+		self.assertTrue(nfa.accepts("w0"))
+		self.assertFalse(nfa.accepts("w10000"))
+
+
+	def test_nfa_nested_plus(self):
+		nfa = NFA.fromPrenex("PLUS " * 30 + "CONCAT a b")
+		self.assertEqual(len(nfa.getStates()), 4 + 2 * 30)
+		self.assertTrue(nfa.accepts("ababab"))
+		self.assertFalse(nfa.accepts("abba"))
@@ -2,6 +2,7 @@ import unittest
 from src.Parser import Parser
 from src.DFA import DFA
 from  src.NFA import NFA
+from src.Simplify import simplify_tree, thompson_states
 class RegexParseTests(unittest.TestCase):
     def test_single_char(self):
         s = "a"
@@ -325,3 +326,61 @@ class RegexParseTests(unittest.TestCase):
         self.assertTrue(DFA.fromPrenex(s).accepts("07cdda "))
         self.assertFalse(DFA.fromPrenex(s).accepts("07bcdda "))
         print("all (6p)")
+
+    def test_counted_repetition(self):
+        s = Parser.toPrenex("[0-9]{3}-(ab|c){1,2}x{2,}")
+        self.assertEqual(s.split()[:3], ["CONCAT", "{3}", "[0-9]"])
+        dfa = DFA.fromPrenex(s)
+        self.assertTrue(dfa.accepts("123-abxx"))
+        self.assertTrue(dfa.accepts("123-cabxxxxx"))
+        self.assertFalse(dfa.accepts("12-abxx"))
+        self.assertFalse(dfa.accepts("123-abcabxx"))
+        self.assertFalse(dfa.accepts("123-abx"))
+        self.assertTrue(NFA.fromPrenex(s).accepts("999-ccxx"))
+
+        s = Parser.toPrenex("a{1,2}{3}b{0}")
+        self.assertEqual([n for n in range(8) if DFA.fromPrenex(s).accepts("a" * n)], [3, 4, 5, 6])
+        self.assertTrue(DFA.fromPrenex(Parser.toPrenex("a{b")).accepts("a{b"))
+        # x{1} is x itself, here another repetition.
+        s = Parser.toPrenex("(a{1,2}){1}b")
+        self.assertEqual([word for word in ["b", "ab", "aab", "aaab"] if NFA.fromPrenex(s).accepts(word)], ["ab", "aab"])
+
+    def test_tree(self):
+        self.assertEqual(Parser.toPrenex("a|b|c"), "UNION a UNION b c")
+        self.assertEqual(Parser.toPrenex("ab*|(c)d?"), "UNION CONCAT a STAR b CONCAT c MAYBE d")
+        self.assertEqual(Parser.toPrenex("' 'x(a|eps)b"), "CONCAT ' ' CONCAT x CONCAT UNION a eps b")
+        self.assertTrue(NFA(Parser.toTree("(" * 5000 + "a" + ")*" * 5000)).accepts("aaa"))
+        for regex in ["", "*a", "a|", "(a", "a)", "a()", "[a-Z]", "[0-9", "'a"]:
+            with self.assertRaises(ValueError):
+                Parser.toTree(regex)
+
+    def test_character_classes(self):
+        s = Parser.toPrenex("[!-/a-fé][^a-z'-']*.")
+        self.assertEqual(s, "CONCAT [!-/a-f\\xe9] CONCAT STAR [^\\x2da-z] [^\\x0a]")
+        dfa = DFA.fromPrenex(s)
+        self.assertTrue(dfa.accepts("#AB\n\U0001f600"))
+        self.assertTrue(dfa.accepts("é?"))
+        self.assertFalse(dfa.accepts("g"))
+        self.assertFalse(dfa.accepts("a-x"))
+        self.assertFalse(dfa.accepts("a\n"))
+        self.assertTrue(NFA.fromPrenex(s).accepts("/\t\n "))
+        self.assertTrue(DFA.fromPrenex(Parser.toPrenex("[']'''''^'x-]+")).accepts("]^'x-"))
+        self.assertEqual(Parser.toPrenex("[x]"), "x")
+        for regex in ["[b-a]", "[a-", "[]", "[^\x00-\U0010ffff]"]:
+            with self.assertRaises(ValueError):
+                Parser.toTree(regex)
+
+    def test_simplify(self):
+        def simplified(regex):
+            return Parser.treeToPrenex(simplify_tree(Parser.toTree(regex)))
+
+        self.assertEqual(simplified("a|b|c|[x-z]"), "[a-cx-z]")
+        self.assertEqual(simplified("(x*)*|a?*"), "UNION STAR x STAR a")
+        self.assertEqual(simplified("epsa(b{1})(eps){0,}"), "CONCAT a b")
+        self.assertEqual(simplified("if|in|int|for|if"), "UNION CONCAT i UNION f CONCAT n MAYBE t CONCAT f CONCAT o r")
+        self.assertEqual(simplified("ax|bx|eps"), "MAYBE CONCAT [a-b] x")
+        self.assertEqual(simplified("a{2,3}|a{2,3}"), "{2,3} a")
+        tree = Parser.toTree("(a|b)*a{1,2}")
+        self.assertEqual(thompson_states(tree), len(NFA(Parser.toTree("(a|b)*a{1,2}")).states))
+        self.assertEqual(thompson_states(simplify_tree(tree)), 10)
+        self.assertTrue(NFA(simplify_tree(tree)).accepts("babaa"))